@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.utils.translation import gettext_lazy as _
+
+
+class PictureConfig(AppConfig):
+    name = 'djangocms_picture'
+    verbose_name = _('Picture')
+
+    def ready(self):
+        from . import signals  # noqa
+        from .instrumentation import connect_receivers
+
+        connect_receivers()
@@ -1,14 +1,56 @@
+import hashlib
+
 from cms.plugin_base import CMSPluginBase
 from cms.plugin_pool import plugin_pool
+from cms.utils.placeholder import restore_sekizai_context
 from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
 from django.utils.translation import gettext_lazy as _
+from sekizai.helpers import Watcher, get_varname
 
 from .forms import PictureForm
-from .models import Picture
+from .instrumentation import measure
+from .models import Picture, prefetch_pictures
 
 # enable nesting of plugins inside the picture plugin
 PICTURE_NESTING = getattr(settings, 'DJANGOCMS_PICTURE_NESTING', False)
 
+FRAGMENT_TEMPLATE = 'djangocms_picture/fragment.html'
+
+# fragments are stored along with their sekizai blocks since version 2
+FRAGMENT_CACHE_VERSION = 2
+
+
+# caches the rendered markup of each plugin, the timeout defaults to the
+# timeout of the cache backend
+def get_fragment_cache():
+    if not getattr(settings, 'DJANGOCMS_PICTURE_FRAGMENT_CACHE', False):
+        return None
+    return caches[getattr(settings, 'DJANGOCMS_PICTURE_FRAGMENT_CACHE_ALIAS', 'default')]
+
+
+# a string used for all templates or a dict mapping template names to the
+# "sizes" attribute of their images
+def get_sizes_setting(template):
+    sizes = getattr(settings, 'DJANGOCMS_PICTURE_SIZES', None)
+    if isinstance(sizes, dict):
+        return sizes.get(template)
+    return sizes
+
+
+def is_loading_attributes_enabled():
+    return getattr(settings, 'DJANGOCMS_PICTURE_LOADING_ATTRIBUTES', True)
+
+
+# the number of pictures per request loaded with high priority, usually
+# the ones above the fold
+def get_eager_images():
+    return getattr(settings, 'DJANGOCMS_PICTURE_EAGER_IMAGES', 1)
+
 
 class PicturePlugin(CMSPluginBase):
     model = Picture
@@ -29,6 +71,8 @@ class PicturePlugin(CMSPluginBase):
             'fields': (
                 'template',
                 'use_responsive_image',
+                'use_modern_formats',
+                'sizes',
                 ('width', 'height'),
                 'alignment',
                 'caption_text',
@@ -53,10 +97,112 @@ class PicturePlugin(CMSPluginBase):
         })
     ]
 
+    @classmethod
+    def get_render_queryset(cls):
+        return super().get_render_queryset().select_related(
+            'picture',
+            'thumbnail_options',
+            'link_page',
+        )
+
+    def prefetch_placeholder(self, instance):
+        # the first picture rendered in a placeholder loads the related
+        # objects of all pictures in it, the others find them cached
+        if not instance._meta.get_field('placeholder').is_cached(instance):
+            return
+        placeholder = instance.placeholder
+        if getattr(placeholder, '_pictures_prefetched', False):
+            return
+        placeholder._pictures_prefetched = True
+        prefetch_pictures(getattr(placeholder, '_all_plugins_cache', [instance]))
+
+    def get_fragment_cache_key(self, context, instance):
+        # the markup only depends on the plugin fields, the image file, the
+        # language and the placeholder dimensions, any change results in a
+        # new key so outdated fragments are never served
+        parts = [
+            (field.attname, field.value_from_object(instance))
+            for field in instance._meta.concrete_fields
+        ]
+        if instance.picture:
+            parts += [
+                instance.picture.sha1,
+                instance.picture.modified_at,
+                instance.picture.file.name,
+                instance.picture.subject_location,
+            ]
+        if instance.thumbnail_options_id:
+            # the preset is edited independently of the plugin
+            thumbnail_options = instance.thumbnail_options
+            parts += [
+                thumbnail_options.width,
+                thumbnail_options.height,
+                thumbnail_options.crop,
+                thumbnail_options.upscale,
+            ]
+        parts += [
+            instance._get_picture_cache_key(),
+            get_language(),
+            context.get('width'),
+            context.get('height'),
+            context['picture_link'],
+            context['picture_sizes'],
+            sorted(context['picture_loading_attributes'].items()),
+        ]
+        digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+        return 'djangocms_picture:fragment:{}'.format(digest)
+
+    def get_picture_sizes(self, context, instance):
+        """
+        Returns the "sizes" attribute, in order of preference from the plugin,
+        a ``picture_sizes`` variable set around the placeholder, the
+        ``DJANGOCMS_PICTURE_SIZES`` setting or the placeholder width.
+        """
+        if instance.sizes:
+            return instance.sizes
+        if context.get('picture_sizes'):
+            return context['picture_sizes']
+        sizes = get_sizes_setting(instance.template)
+        if sizes:
+            return sizes
+        slot_width = context.get('width')
+        if slot_width and getattr(settings, 'DJANGOCMS_PICTURE_SIZES_FROM_WIDTH', False):
+            return '(max-width: {0}px) 100vw, {0}px'.format(int(slot_width))
+        return None
+
+    def get_loading_attributes(self, context, instance):
+        """
+        Returns the ``loading``, ``decoding`` and ``fetchpriority`` attributes
+        of the image. The first pictures rendered in a request are loaded
+        eagerly, attributes set on the plugin take precedence.
+        """
+        if not is_loading_attributes_enabled():
+            return {}
+        request = context.get('request')
+        index = getattr(request, '_djangocms_picture_count', 0)
+        if request is not None:
+            request._djangocms_picture_count = index + 1
+
+        if index < get_eager_images():
+            attributes = {'loading': 'eager', 'decoding': 'async', 'fetchpriority': 'high'}
+        else:
+            attributes = {'loading': 'lazy', 'decoding': 'async'}
+        return {
+            name: value for name, value in attributes.items()
+            if name not in instance.attributes
+        }
+
     def get_render_template(self, context, instance, placeholder):
+        if 'picture_fragment' in context:
+            return FRAGMENT_TEMPLATE
         return 'djangocms_picture/{}/picture.html'.format(instance.template)
 
     def render(self, context, instance, placeholder):
+        with measure('render', sender=type(instance), instance=instance):
+            return self.render_picture(context, instance, placeholder)
+
+    def render_picture(self, context, instance, placeholder):
+        self.prefetch_placeholder(instance)
         if instance.alignment:
             classes = 'align-{} '.format(instance.alignment)
             classes += instance.attributes.get('class', '')
@@ -65,13 +211,50 @@ class PicturePlugin(CMSPluginBase):
             instance.attributes['class'] = classes
         # assign link to a context variable to be performant
         context['picture_link'] = instance.get_link()
-        context['picture_size'] = instance.get_size(
+        context['picture_sizes'] = self.get_picture_sizes(context, instance)
+        context['picture_loading_attributes'] = self.get_loading_attributes(context, instance)
+
+        # nested plugins change independently of the picture, do not cache them
+        cache = get_fragment_cache()
+        if cache is not None and not getattr(instance, 'child_plugin_instances', None):
+            cache_key = self.get_fragment_cache_key(context, instance)
+            fragment = cache.get(cache_key, version=FRAGMENT_CACHE_VERSION)
+            if fragment is not None:
+                # replays the css and js the template added with sekizai, as
+                # the placeholder cache of the CMS does
+                if fragment['sekizai'] and context.get(get_varname()) is not None:
+                    restore_sekizai_context(context, fragment['sekizai'])
+                context['picture_fragment'] = mark_safe(fragment['content'])
+                return super().render(context, instance, placeholder)
+        else:
+            cache_key = None
+
+        # the size, source and srcset are memoized on the instance, the
+        # template reuses them instead of resolving the thumbnails again
+        context['picture_size'] = instance.get_cached_size(
             width=context.get('width') or 0,
             height=context.get('height') or 0,
         )
         context['img_srcset_data'] = instance.img_srcset_data
+        context['img_density_srcset_data'] = instance.img_density_srcset_data
+        context['picture_sources'] = instance.img_sources
+        context['picture_preview'] = instance.preview
+        context['picture_dimensions'] = instance.img_dimensions
+        context = super().render(context, instance, placeholder)
 
-        return super().render(context, instance, placeholder)
+        # thumbnails generated in the background are swapped in later
+        if cache_key and not instance.has_pending_thumbnails():
+            template = get_template(self.get_render_template(context, instance, placeholder))
+            watcher = Watcher(context)
+            fragment = template.render(context.flatten())
+            cache.set(
+                cache_key,
+                {'content': fragment, 'sekizai': watcher.get_changes()},
+                getattr(settings, 'DJANGOCMS_PICTURE_FRAGMENT_CACHE_TIMEOUT', DEFAULT_TIMEOUT),
+                version=FRAGMENT_CACHE_VERSION,
+            )
+            context['picture_fragment'] = fragment
+        return context
 
 
 plugin_pool.register_plugin(PicturePlugin)
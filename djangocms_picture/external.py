@@ -0,0 +1,326 @@
+"""
+Fetches external pictures into the local storage, so they are resized and
+served like images uploaded to filer.
+"""
+import hashlib
+import http.client
+import ipaddress
+import logging
+import socket
+import urllib.error
+import urllib.request
+from datetime import timedelta
+from functools import lru_cache
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from PIL import ExifTags, ImageFile
+from PIL import Image as PILImage
+
+from .thumbnails import TRANSPOSED_ORIENTATIONS
+
+logger = logging.getLogger(__name__)
+
+# file extensions of the formats Pillow reports, the lowercased format
+# name is used for all others
+FORMAT_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'TIFF': 'tif',
+}
+
+
+def is_external_cache_enabled():
+    return getattr(settings, 'DJANGOCMS_PICTURE_EXTERNAL_IMAGES', False)
+
+
+def is_probe_enabled():
+    return getattr(settings, 'DJANGOCMS_PICTURE_EXTERNAL_IMAGES_PROBE', False)
+
+
+# seconds after which the local copy is revalidated
+def get_external_ttl():
+    return getattr(settings, 'DJANGOCMS_PICTURE_EXTERNAL_IMAGES_TTL', 60 * 60 * 24)
+
+
+def get_external_timeout():
+    return getattr(settings, 'DJANGOCMS_PICTURE_EXTERNAL_IMAGES_TIMEOUT', 10)
+
+
+def get_external_max_size():
+    return getattr(settings, 'DJANGOCMS_PICTURE_EXTERNAL_IMAGES_MAX_SIZE', 10 * 1024 * 1024)
+
+
+# the number of bytes read at most to find the dimensions of an image
+def get_probe_max_size():
+    return getattr(settings, 'DJANGOCMS_PICTURE_EXTERNAL_IMAGES_PROBE_MAX_SIZE', 64 * 1024)
+
+
+class ExternalResponse:
+    """
+    The result of fetching an external image, ``not_modified`` is true if
+    the server confirmed the local copy is still current.
+    """
+
+    def __init__(self, content=None, etag='', last_modified='', not_modified=False):
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = not_modified
+
+
+# the exceptions of a failed download or of an invalid image
+FETCH_ERRORS = (OSError, ValueError, http.client.HTTPException, PILImage.DecompressionBombError)
+
+
+# hosts that may resolve to loopback, private or link-local addresses,
+# e.g. an image server in the local network
+def get_allowed_hosts():
+    return getattr(settings, 'DJANGOCMS_PICTURE_EXTERNAL_IMAGES_ALLOWED_HOSTS', [])
+
+
+def get_public_addresses(host, port):
+    """
+    Returns the ``getaddrinfo`` results of ``host``, raises ``ValueError``
+    if any of its addresses is not public.
+    """
+    try:
+        addresses = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+    except socket.gaierror as error:
+        raise ValueError('Could not resolve {}'.format(host)) from error
+    for *info, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split('%', 1)[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ValueError('{} is not a public address: {}'.format(host, address))
+    return addresses
+
+
+def check_url(url):
+    """
+    Raises ``ValueError`` unless ``url`` is an http or https URL whose host
+    only resolves to public addresses, so editors cannot make the server
+    request internal services.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError('Only http and https URLs can be fetched: {}'.format(url))
+    if parts.hostname in get_allowed_hosts():
+        return
+    get_public_addresses(parts.hostname, parts.port or parts.scheme)
+
+
+def create_connection(address, timeout, source_address=None):
+    # connects to an address checked by this lookup, resolving the host
+    # again after ``check_url`` could return another one (DNS rebinding)
+    host, port = address
+    if host in get_allowed_hosts():
+        return socket.create_connection(address, timeout, source_address)
+    error = None
+    for *info, sockaddr in get_public_addresses(host, port):
+        try:
+            return socket.create_connection(sockaddr[:2], timeout, source_address)
+        except OSError as exc:
+            error = exc
+    raise error
+
+
+class CheckedHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = create_connection
+
+
+class CheckedHTTPSConnection(http.client.HTTPSConnection):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = create_connection
+
+
+class CheckedHTTPHandler(urllib.request.HTTPHandler):
+
+    def http_open(self, req):
+        return self.do_open(CheckedHTTPConnection, req)
+
+
+class CheckedHTTPSHandler(urllib.request.HTTPSHandler):
+
+    def https_open(self, req):
+        return self.do_open(CheckedHTTPSConnection, req)
+
+
+class CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    # redirects are only followed to URLs passing ``check_url``
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def urlopen(request, timeout):
+    return urllib.request.build_opener(
+        CheckedHTTPHandler,
+        CheckedHTTPSHandler,
+        CheckedRedirectHandler,
+    ).open(request, timeout=timeout)
+
+
+def fetch(url, etag='', last_modified=''):
+    """
+    Downloads ``url`` over HTTP, revalidating the local copy with the given
+    ``etag`` and ``last_modified`` values.
+    """
+    check_url(url)
+
+    headers = {'User-Agent': 'djangocms-picture'}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    request = urllib.request.Request(url, headers=headers)
+
+    max_size = get_external_max_size()
+    try:
+        with urlopen(request, get_external_timeout()) as response:
+            content = response.read(max_size + 1)
+            if len(content) > max_size:
+                raise ValueError('The external image is larger than {} bytes: {}'.format(max_size, url))
+            return ExternalResponse(
+                content=content,
+                etag=response.headers.get('ETag', ''),
+                last_modified=response.headers.get('Last-Modified', ''),
+            )
+    except urllib.error.HTTPError as error:
+        if error.code == 304:
+            return ExternalResponse(etag=etag, last_modified=last_modified, not_modified=True)
+        raise
+
+
+def get_oriented_size(image):
+    # the size of the PIL ``image`` rotated by its EXIF orientation, like
+    # easy_thumbnails rotates it before resizing
+    width, height = image.size
+    if image.getexif().get(ExifTags.Base.Orientation) in TRANSPOSED_ORIENTATIONS:
+        return height, width
+    return width, height
+
+
+def probe(url):
+    """
+    Returns the width, height and format of the image at ``url``, reading
+    only as many bytes as needed to parse its header. The dimensions are
+    rotated by the EXIF orientation.
+    """
+    check_url(url)
+    max_size = get_probe_max_size()
+    # servers ignoring the range still only send what is read
+    request = urllib.request.Request(url, headers={
+        'User-Agent': 'djangocms-picture',
+        'Range': 'bytes=0-{}'.format(max_size - 1),
+    })
+
+    parser = ImageFile.Parser()
+    with urlopen(request, get_external_timeout()) as response:
+        size = 0
+        while parser.image is None and size < max_size:
+            chunk = response.read(1024)
+            if not chunk:
+                break
+            size += len(chunk)
+            parser.feed(chunk)
+    if parser.image is None:
+        raise ValueError('Could not read the dimensions of the external image: {}'.format(url))
+    width, height = get_oriented_size(parser.image)
+    return width, height, parser.image.format
+
+
+@lru_cache(maxsize=None)
+def load_fetcher(path):
+    return import_string(path)
+
+
+def get_fetcher():
+    return load_fetcher(getattr(
+        settings,
+        'DJANGOCMS_PICTURE_EXTERNAL_IMAGES_FETCHER',
+        'djangocms_picture.external.fetch',
+    ))
+
+
+def get_prober():
+    return load_fetcher(getattr(
+        settings,
+        'DJANGOCMS_PICTURE_EXTERNAL_IMAGES_PROBER',
+        'djangocms_picture.external.probe',
+    ))
+
+
+def is_outdated(timestamp):
+    # true if ``timestamp`` is missing or older than the TTL
+    if timestamp is None:
+        return True
+    return timezone.now() - timestamp > timedelta(seconds=get_external_ttl())
+
+
+def refresh_external_image(external_image):
+    """
+    Fetches or revalidates the local copy of ``external_image``, returns
+    whether it is usable. Failures are retried once the copy is stale again.
+    """
+    try:
+        response = get_fetcher()(
+            external_image.external_url,
+            etag=external_image.etag,
+            last_modified=external_image.last_modified,
+        )
+        if not response.not_modified:
+            with PILImage.open(BytesIO(response.content)) as image:
+                width, height = get_oriented_size(image)
+                image_format = image.format
+                extension = FORMAT_EXTENSIONS.get(image_format, image_format.lower())
+            # content addressed names give changed images new thumbnails
+            sha1 = hashlib.sha1(response.content).hexdigest()
+            if sha1 != external_image.sha1 or not external_image.file:
+                old_name = external_image.file.name
+                external_image.file.save(
+                    '{}.{}'.format(sha1, extension),
+                    ContentFile(response.content),
+                    save=False,
+                )
+                if old_name and old_name != external_image.file.name:
+                    external_image.file.storage.delete(old_name)
+            external_image.sha1 = sha1
+            external_image.width = width
+            external_image.height = height
+            external_image.format = image_format
+        external_image.etag = response.etag
+        external_image.last_modified = response.last_modified
+    except FETCH_ERRORS:
+        logger.warning('Could not fetch external image %s', external_image.external_url, exc_info=True)
+    external_image.fetched_at = timezone.now()
+    external_image.save()
+    return bool(external_image.file)
+
+
+def probe_external_image(external_image):
+    """
+    Stores the dimensions and format of ``external_image`` without
+    downloading it, returns whether they are known.
+    """
+    try:
+        width, height, image_format = get_prober()(external_image.external_url)
+    except FETCH_ERRORS:
+        logger.warning('Could not probe external image %s', external_image.external_url, exc_info=True)
+    else:
+        external_image.width = width
+        external_image.height = height
+        external_image.format = image_format
+    external_image.probed_at = timezone.now()
+    external_image.save()
+    return bool(external_image.width and external_image.height)
@@ -0,0 +1,112 @@
+"""
+Reports the duration and database queries of rendering pictures and
+resolving their thumbnails. Nothing is measured unless a receiver is
+connected to ``picture_measured``::
+
+    from djangocms_picture.instrumentation import picture_measured
+
+    def receiver(sender, operation, duration, queries, **kwargs):
+        ...
+
+    picture_measured.connect(receiver)
+
+``operation`` is one of "render", "get_size", "img_src",
+"img_srcset_data", "get_thumbnail" and "generate_thumbnails", ``duration``
+is given in seconds. Thumbnails additionally report ``cache_hit``,
+``pending`` and the ``bytes`` of generated files, thumbnails generated
+together are reported once with their ``count``.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.dispatch import Signal
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+picture_measured = Signal()
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def measure(operation, sender=None, **info):
+    """
+    Measures the block and sends ``picture_measured``. Yields a dict the
+    block can add details to, or None if nobody listens.
+    """
+    if not picture_measured.has_listeners():
+        yield None
+        return
+    counter = QueryCounter()
+    start = time.perf_counter()
+    with connection.execute_wrapper(counter):
+        yield info
+    picture_measured.send(
+        sender=sender,
+        operation=operation,
+        duration=time.perf_counter() - start,
+        queries=counter.count,
+        **info
+    )
+
+
+def measured(operation):
+    # measures a method of a picture model
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with measure(operation, sender=type(self), instance=self):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def log_measurement(sender, operation, duration, queries, **kwargs):
+    logger.debug(
+        '%s took %.2fms and %d queries%s',
+        operation,
+        duration * 1000,
+        queries,
+        ' (cache hit)' if kwargs.get('cache_hit') else '',
+    )
+
+
+class StatsdReceiver:
+    """
+    Sends the measurements to a statsd style client providing ``timing``
+    and ``incr``::
+
+        picture_measured.connect(StatsdReceiver(client), weak=False)
+    """
+
+    def __init__(self, client, prefix='djangocms_picture'):
+        self.client = client
+        self.prefix = prefix
+
+    def __call__(self, sender, operation, duration, queries, **kwargs):
+        name = '{}.{}'.format(self.prefix, operation)
+        self.client.timing(name, duration * 1000)
+        self.client.timing('{}.queries'.format(name), queries)
+        if 'cache_hit' in kwargs:
+            self.client.incr('{}.{}'.format(name, 'hit' if kwargs['cache_hit'] else 'miss'))
+        if kwargs.get('bytes'):
+            self.client.incr('{}.bytes'.format(name), kwargs['bytes'])
+
+
+def connect_receivers():
+    # connects the receivers listed in ``DJANGOCMS_PICTURE_INSTRUMENTATION``
+    for path in getattr(settings, 'DJANGOCMS_PICTURE_INSTRUMENTATION', []):
+        picture_measured.connect(import_string(path), dispatch_uid=path)
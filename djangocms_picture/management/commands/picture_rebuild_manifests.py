@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+
+from djangocms_picture.models import Picture
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the variant manifests of all picture plugins.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start-pk',
+            type=int,
+            default=0,
+            help='Resume with the pictures starting at this primary key.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of pictures loaded at once.',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Rebuild manifests that are up to date as well.',
+        )
+
+    def handle(self, *args, **options):
+        queryset = (
+            Picture.objects
+            .filter(pk__gte=options['start_pk'])
+            .select_related('picture', 'thumbnail_options')
+            .order_by('pk')
+        )
+        total = queryset.count()
+        processed = 0
+        updated = 0
+        last_pk = options['start_pk'] - 1
+
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk)[:options['chunk_size']])
+            if not chunk:
+                break
+
+            for instance in chunk:
+                if instance.refresh_variant_manifest(force=options['force']):
+                    updated += 1
+
+            processed += len(chunk)
+            last_pk = chunk[-1].pk
+            self.stdout.write(
+                '{}/{} pictures processed, {} manifests updated, last pk {}'.format(
+                    processed, total, updated, last_pk,
+                )
+            )
+
+        self.stdout.write(self.style.SUCCESS('{} manifests updated.'.format(updated)))
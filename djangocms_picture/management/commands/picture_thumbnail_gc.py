@@ -0,0 +1,217 @@
+import os
+import re
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from easy_thumbnails.files import get_thumbnailer
+from easy_thumbnails.models import Thumbnail
+from filer import settings as filer_settings
+from filer.models import File
+from filer.models.abstract import BaseImage
+
+from djangocms_picture.models import (
+    ExternalImage,
+    Picture,
+    prefetch_external_images,
+)
+from djangocms_picture.thumbnails import (
+    get_immutable_thumbnails_dir,
+    get_picture_thumbnailer,
+)
+
+# ``<source filename>__<options>.<extension>``, as filer names thumbnails
+FILER_THUMBNAIL_NAME = re.compile(r'^(?P<source>.+)__\d+x\d+[^/]*\.\w+$')
+
+# ``<source sha1>_<options hash>.<extension>``, see
+# ``get_immutable_thumbnail_name``
+IMMUTABLE_THUMBNAIL_NAME = re.compile(r'^(?P<sha1>[0-9a-f]{40})_[0-9a-f]{12}\.\w+$')
+
+
+def get_filer_thumbnail_options(image):
+    # the thumbnails filer's admin shows for ``image``
+    subject_location = image.subject_location
+    options = [
+        dict(thumbnail_options, subject_location=subject_location)
+        for thumbnail_options in BaseImage.DEFAULT_THUMBNAILS.values()
+    ]
+    options += [
+        {'size': (int(size), int(size)), 'crop': True, 'upscale': True, 'subject_location': subject_location}
+        for size in filer_settings.FILER_ADMIN_ICON_SIZES
+    ]
+    options += [
+        {'size': (size, size), 'crop': True}
+        for size in filer_settings.DEFERRED_THUMBNAIL_SIZES
+    ]
+    return options
+
+
+def get_thumbnail_names(thumbnailer, thumbnail_options):
+    # transparent thumbnails may be stored with another extension
+    thumbnail_options = thumbnailer.get_options(thumbnail_options)
+    return {
+        thumbnailer.get_thumbnail_name(thumbnail_options),
+        thumbnailer.get_thumbnail_name(thumbnail_options, transparent=True),
+    }
+
+
+def walk(storage, path):
+    # yields the names of all files below ``path`` without listing the
+    # whole storage at once
+    try:
+        directories, files = storage.listdir(path)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield os.path.join(path, name)
+    for directory in directories:
+        yield from walk(storage, os.path.join(path, directory))
+
+
+class Command(BaseCommand):
+    help = 'Deletes the thumbnails of deleted or replaced filer images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of thumbnails checked and deleted at once.',
+        )
+        parser.add_argument(
+            '--stale',
+            action='store_true',
+            help=(
+                'Also delete the thumbnails of images shown by picture plugins '
+                'that none of these plugins renders anymore.'
+            ),
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the thumbnails that would be deleted.',
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='Print the name of every deleted thumbnail.',
+        )
+
+    def get_live_thumbnails(self):
+        # the thumbnails the picture plugins render and the ones filer's
+        # admin shows for their images, along with the names and checksums
+        # of these images
+        live = set()
+        sources = set()
+        checksums = set()
+        images = set()
+        queryset = Picture.objects.select_related('picture', 'thumbnail_options').order_by('pk')
+        pictures = queryset.iterator(chunk_size=500)
+        while True:
+            chunk = list(islice(pictures, 500))
+            if not chunk:
+                break
+            # external pictures are never fetched, only existing copies count
+            prefetch_external_images(chunk)
+            for instance in chunk:
+                source = instance.source_image
+                if not source:
+                    continue
+                for thumbnail_options, extension in instance.get_thumbnail_variants():
+                    live |= get_thumbnail_names(get_picture_thumbnailer(source, extension), thumbnail_options)
+                sources.add(source.file.name)
+                checksums.add(source.sha1)
+                if instance.picture_id and instance.picture_id not in images:
+                    images.add(instance.picture_id)
+                    thumbnailer = get_thumbnailer(source)
+                    for thumbnail_options in get_filer_thumbnail_options(source):
+                        live |= get_thumbnail_names(thumbnailer, thumbnail_options)
+        return live, sources, checksums
+
+    def get_candidates(self, storage, live):
+        # yields (thumbnail name, source name, source checksum) of every
+        # thumbnail not in use, files not named like thumbnails are skipped
+        base_dir = filer_settings.FILER_PUBLICMEDIA_THUMBNAIL_OPTIONS.get('base_dir', '').strip('/')
+        immutable_dir = get_immutable_thumbnails_dir().strip('/')
+        roots = [base_dir]
+        if base_dir and not immutable_dir.startswith(base_dir + '/'):
+            roots.append(immutable_dir)
+        for root in roots:
+            for name in walk(storage, root):
+                if name in live:
+                    continue
+                directory, filename = os.path.split(name)
+                match = IMMUTABLE_THUMBNAIL_NAME.match(filename)
+                if match and name.startswith(immutable_dir + '/'):
+                    yield name, None, match.group('sha1')
+                    continue
+                match = FILER_THUMBNAIL_NAME.match(filename)
+                if match and root == base_dir:
+                    # filer stores thumbnails below the path of their image
+                    if base_dir:
+                        directory = directory[len(base_dir):].lstrip('/')
+                    yield name, os.path.join(directory, match.group('source')), None
+
+    def get_garbage(self, batch, sources, checksums, stale):
+        # the thumbnails of ``batch`` whose image is gone, with ``stale`` also
+        # the ones not used by the picture plugins showing their image, these
+        # may be referenced by other applications, cached pages or CDNs
+        existing = set(File.objects.filter(
+            file__in=[source for name, source, sha1 in batch if source],
+        ).values_list('file', flat=True))
+        batch_checksums = [sha1 for name, source, sha1 in batch if sha1]
+        existing_checksums = set(File.objects.filter(
+            sha1__in=batch_checksums,
+        ).values_list('sha1', flat=True))
+        existing_checksums.update(ExternalImage.objects.filter(
+            sha1__in=batch_checksums,
+        ).values_list('sha1', flat=True))
+
+        garbage = []
+        for name, source, sha1 in batch:
+            if source:
+                orphaned = source not in existing
+                unused = source in sources
+            else:
+                orphaned = sha1 not in existing_checksums
+                unused = sha1 in checksums
+            if orphaned or stale and unused:
+                garbage.append(name)
+        return garbage
+
+    def handle(self, *args, **options):
+        storage = filer_settings.FILER_PUBLICMEDIA_THUMBNAIL_STORAGE
+        live, sources, checksums = self.get_live_thumbnails()
+        self.stdout.write('{} thumbnails in use.'.format(len(live)))
+
+        checked = 0
+        deleted = 0
+        deleted_bytes = 0
+        candidates = self.get_candidates(storage, live)
+        while True:
+            batch = list(islice(candidates, options['batch_size']))
+            if not batch:
+                break
+            garbage = self.get_garbage(batch, sources, checksums, options['stale'])
+            for name in garbage:
+                deleted_bytes += storage.size(name)
+                if options['list']:
+                    self.stdout.write(name)
+                if not options['dry_run']:
+                    storage.delete(name)
+            if garbage and not options['dry_run']:
+                # easy_thumbnails would otherwise still consider them generated
+                Thumbnail.objects.filter(name__in=garbage).delete()
+            checked += len(batch)
+            deleted += len(garbage)
+            self.stdout.write('{} unused thumbnails checked, {} {}'.format(
+                checked, deleted, 'to delete' if options['dry_run'] else 'deleted',
+            ))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                '{} thumbnails would be deleted, freeing {} bytes.'.format(deleted, deleted_bytes)
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                '{} thumbnails deleted, {} bytes freed.'.format(deleted, deleted_bytes)
+            ))
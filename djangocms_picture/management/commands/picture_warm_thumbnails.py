@@ -0,0 +1,162 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from djangocms_picture.models import Picture
+from djangocms_picture.thumbnails import (
+    generate_missing_thumbnails,
+    get_missing_thumbnails,
+    get_thumbnail_cache,
+    read_orientation,
+)
+
+
+def init_worker():
+    django.setup()
+
+
+def warm_image(image_pk, variants):
+    image_model = Picture._meta.get_field('picture').related_model
+    image = image_model.objects.get(pk=image_pk)
+    return generate_missing_thumbnails(image, variants)
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates the missing thumbnails of all picture plugins and stores '
+        'the orientation of their images if missing.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start-pk',
+            type=int,
+            default=0,
+            help='Resume with the pictures starting at this primary key.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of pictures loaded at once.',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=None,
+            help='Number of worker processes, defaults to the number of CPUs.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the missing thumbnails and orientations.',
+        )
+
+    def store_orientations(self, chunk, dry_run):
+        # pictures saved before the orientation was stored read it once per
+        # image, returns the number of pictures updated
+        missing = {}
+        for instance in chunk:
+            if instance.picture_orientation is None:
+                missing.setdefault(instance.picture_id, []).append(instance)
+        if dry_run:
+            return sum(len(instances) for instances in missing.values())
+        cache = get_thumbnail_cache()
+        count = 0
+        for image_pk, instances in missing.items():
+            orientation = read_orientation(instances[0].picture)
+            if orientation is None:
+                continue
+            Picture.objects.filter(pk__in=[instance.pk for instance in instances]).update(
+                picture_orientation=orientation,
+            )
+            for instance in instances:
+                instance.picture_orientation = orientation
+            # resolved thumbnails were measured without the orientation
+            if cache is not None:
+                cache.invalidate(instances[0].picture.sha1)
+            count += len(instances)
+        return count
+
+    def handle(self, *args, **options):
+        queryset = (
+            Picture.objects
+            .filter(pk__gte=options['start_pk'], picture__isnull=False)
+            .select_related('picture', 'thumbnail_options')
+            .order_by('pk')
+        )
+        executor = None
+        if not options['dry_run'] and options['processes'] != 1:
+            # forked workers must not inherit an open database connection,
+            # closing it in a worker would end the session of the parent.
+            # The workers are started before the first query, forking
+            # executors start all of them with the first job.
+            connections.close_all()
+            executor = ProcessPoolExecutor(
+                max_workers=options['processes'],
+                initializer=init_worker,
+            )
+            executor.submit(os.getpid).result()
+
+        total = queryset.count()
+        processed = 0
+        missing_count = 0
+        orientation_count = 0
+        last_pk = options['start_pk'] - 1
+
+        try:
+            while True:
+                chunk = list(queryset.filter(pk__gt=last_pk)[:options['chunk_size']])
+                if not chunk:
+                    break
+                orientation_count += self.store_orientations(chunk, options['dry_run'])
+
+                # group the variants by image, plugins sharing an image only
+                # generate its thumbnails once
+                images = {}
+                for instance in chunk:
+                    image, variants = images.setdefault(instance.picture_id, (instance.picture, []))
+                    variants.extend(instance.get_thumbnail_variants())
+
+                jobs = []
+                for image_pk, (image, variants) in images.items():
+                    missing = get_missing_thumbnails(image, variants)
+                    if missing:
+                        missing_count += len(missing)
+                        jobs.append((image_pk, missing))
+
+                if not options['dry_run']:
+                    if executor:
+                        list(executor.map(
+                            warm_image,
+                            [image_pk for image_pk, missing in jobs],
+                            [missing for image_pk, missing in jobs],
+                        ))
+                    else:
+                        for image_pk, missing in jobs:
+                            generate_missing_thumbnails(images[image_pk][0], missing)
+
+                processed += len(chunk)
+                last_pk = chunk[-1].pk
+                self.stdout.write(
+                    '{}/{} pictures processed, {} missing thumbnails, last pk {}'.format(
+                        processed, total, missing_count, last_pk,
+                    )
+                )
+        finally:
+            if executor:
+                executor.shutdown()
+
+        if options['dry_run']:
+            self.stdout.write('{} orientations would be stored.'.format(orientation_count))
+            self.stdout.write(self.style.SUCCESS(
+                '{} thumbnails would be generated.'.format(missing_count)
+            ))
+        else:
+            self.stdout.write('{} orientations stored.'.format(orientation_count))
+            self.stdout.write(self.style.SUCCESS(
+                '{} thumbnails generated.'.format(missing_count)
+            ))
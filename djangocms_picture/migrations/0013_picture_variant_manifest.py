@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangocms_picture', '0012_alter_picture_cmsplugin_ptr'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='picture',
+            name='variant_manifest',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Variant manifest'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangocms_picture', '0013_picture_variant_manifest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='picture',
+            name='use_modern_formats',
+            field=models.CharField(choices=[('inherit', 'Let settings.DJANGOCMS_PICTURE_MODERN_IMAGES decide'), ('yes', 'Yes'), ('no', 'No')], default='inherit', help_text='Additionally provides AVIF and WebP versions of the image to browsers supporting them. This configuration only applies to uploaded images that are not shown in their original size.', max_length=7, verbose_name='Use modern image formats'),
+        ),
+    ]
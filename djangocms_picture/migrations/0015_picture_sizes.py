@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangocms_picture', '0014_picture_use_modern_formats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='picture',
+            name='sizes',
+            field=models.CharField(blank=True, help_text='The "sizes" attribute of responsive images describing the width of the image in the layout. Example: "(min-width: 992px) 33vw, 100vw".', max_length=255, verbose_name='Sizes'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangocms_picture', '0015_picture_sizes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExternalImage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_url', models.URLField(max_length=255, unique=True, verbose_name='External URL')),
+                ('file', models.FileField(blank=True, max_length=255, upload_to='external_pictures', verbose_name='File')),
+                ('sha1', models.CharField(blank=True, max_length=40, verbose_name='Checksum')),
+                ('width', models.PositiveIntegerField(blank=True, help_text='Rotated by the EXIF orientation of the image.', null=True, verbose_name='Width')),
+                ('height', models.PositiveIntegerField(blank=True, help_text='Rotated by the EXIF orientation of the image.', null=True, verbose_name='Height')),
+                ('etag', models.CharField(blank=True, max_length=255, verbose_name='ETag')),
+                ('last_modified', models.CharField(blank=True, max_length=64, verbose_name='Last modified')),
+                ('fetched_at', models.DateTimeField(blank=True, null=True, verbose_name='Fetched at')),
+            ],
+            options={
+                'verbose_name': 'External image',
+                'verbose_name_plural': 'External images',
+            },
+        ),
+    ]
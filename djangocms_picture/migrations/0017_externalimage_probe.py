@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangocms_picture', '0016_externalimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='externalimage',
+            name='format',
+            field=models.CharField(blank=True, max_length=16, verbose_name='Format'),
+        ),
+        migrations.AddField(
+            model_name='externalimage',
+            name='probed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Probed at'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangocms_picture', '0017_externalimage_probe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='picture',
+            name='picture_orientation',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='Image orientation'),
+        ),
+    ]
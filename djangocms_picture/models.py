@@ -2,17 +2,46 @@
 Enables the user to add an "Image" plugin that displays an image
 using the HTML <img> tag.
 """
-from cms.models import CMSPlugin
+import hashlib
+
+from cms.models import CMSPlugin, Page
 from cms.models.fields import PageField
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import prefetch_related_objects
 from django.utils.translation import gettext
 from django.utils.translation import gettext_lazy as _
 from djangocms_attributes_field.fields import AttributesField
+from easy_thumbnails.exceptions import EasyThumbnailsError
 from easy_thumbnails.files import get_thumbnailer
 from filer.fields.image import FilerImageField
 from filer.models import ThumbnailOption
+from PIL import Image as PILImage
+
+from .external import (
+    is_external_cache_enabled,
+    is_outdated,
+    is_probe_enabled,
+    probe_external_image,
+    refresh_external_image,
+)
+from .instrumentation import measured
+from .previews import get_preview, is_preview_enabled
+from .sizes import compute_sizes
+from .thumbnails import (
+    TRANSPOSED_ORIENTATIONS,
+    PendingThumbnail,
+    StoredThumbnail,
+    VariantSpec,
+    get_backend,
+    get_source_size,
+    get_thumbnail_dimensions,
+    get_thumbnails,
+    is_async_enabled,
+    is_immutable_thumbnails_enabled,
+    read_orientation,
+)
 
 
 # add setting for picture alignment, renders a class or inline styles
@@ -43,6 +72,27 @@ def get_templates():
     return choices
 
 
+def get_responsive_image_breakpoints():
+    return getattr(
+        settings,
+        'DJANGOCMS_PICTURE_RESPONSIVE_IMAGES_VIEWPORT_BREAKPOINTS',
+        [576, 768, 992],
+    )
+
+
+# e.g. [1, 2, 3] renders density instead of width descriptors
+def get_responsive_image_densities():
+    return getattr(
+        settings,
+        'DJANGOCMS_PICTURE_RESPONSIVE_IMAGES_DENSITIES',
+        None,
+    )
+
+
+def is_variant_manifest_enabled():
+    return getattr(settings, 'DJANGOCMS_PICTURE_VARIANT_MANIFEST', False)
+
+
 # use golden ration as default (https://en.wikipedia.org/wiki/Golden_ratio)
 PICTURE_RATIO = getattr(settings, 'DJANGOCMS_PICTURE_RATIO', 1.6180)
 
@@ -63,6 +113,33 @@ RESPONSIVE_IMAGE_CHOICES = (
 )
 
 
+MODERN_FORMAT_CHOICES = (
+    ('inherit', _('Let settings.DJANGOCMS_PICTURE_MODERN_IMAGES decide')),
+    ('yes', _('Yes')),
+    ('no', _('No')),
+)
+
+MODERN_FORMAT_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+}
+
+
+# formats are listed by preference, the ones the installed Pillow cannot
+# write are skipped
+def get_modern_image_formats():
+    formats = getattr(
+        settings,
+        'DJANGOCMS_PICTURE_MODERN_IMAGE_FORMATS',
+        ['avif', 'webp'],
+    )
+    extensions = PILImage.registered_extensions()
+    return [
+        extension for extension in formats
+        if extensions.get('.{}'.format(extension)) in PILImage.SAVE
+    ]
+
+
 class AbstractPicture(CMSPlugin):
     """
     Renders an image with the option of adding a link
@@ -192,6 +269,25 @@ class AbstractPicture(CMSPlugin):
             'This configuration only applies to uploaded images (external pictures will not be affected). '
         )
     )
+    use_modern_formats = models.CharField(
+        verbose_name=_('Use modern image formats'),
+        max_length=7,
+        choices=MODERN_FORMAT_CHOICES,
+        default=MODERN_FORMAT_CHOICES[0][0],
+        help_text=_(
+            'Additionally provides AVIF and WebP versions of the image to browsers supporting them. '
+            'This configuration only applies to uploaded images that are not shown in their original size.'
+        )
+    )
+    sizes = models.CharField(
+        verbose_name=_('Sizes'),
+        blank=True,
+        max_length=255,
+        help_text=_(
+            'The "sizes" attribute of responsive images describing the width of the image in the layout. '
+            'Example: "(min-width: 992px) 33vw, 100vw".'
+        ),
+    )
     # overrides all other options
     # throws validation error if other cropping options are selected
     thumbnail_options = models.ForeignKey(
@@ -203,6 +299,23 @@ class AbstractPicture(CMSPlugin):
         on_delete=models.CASCADE,
     )
 
+    # resolved thumbnails of ``img_src`` and the srcset, see
+    # ``build_variant_manifest``
+    variant_manifest = models.JSONField(
+        verbose_name=_('Variant manifest'),
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    # the EXIF orientation of the filer image, read when the plugin or the
+    # image is saved so rendering never opens the file
+    picture_orientation = models.PositiveSmallIntegerField(
+        verbose_name=_('Image orientation'),
+        blank=True,
+        null=True,
+        editable=False,
+    )
+
     # Add an app namespace to related_name to avoid field name clashes
     # with any other plugins that have a field with the same name as the
     # lowercase of the class name of this model.
@@ -229,11 +342,29 @@ class AbstractPicture(CMSPlugin):
             return self.picture.label
         return gettext('<file is missing>')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the image the stored orientation was read from
+        instance._loaded_picture_id = instance.__dict__.get('picture_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if not self.picture_id:
+            self.picture_orientation = None
+        elif self.picture_orientation is None or self.picture_id != getattr(self, '_loaded_picture_id', None):
+            self.picture_orientation = read_orientation(self.picture)
+        self._loaded_picture_id = self.picture_id
+        if is_variant_manifest_enabled():
+            self.refresh_variant_manifest(commit=False)
+        super().save(*args, **kwargs)
+
     def copy_relations(self, oldinstance):
         # Because we have a ForeignKey, it's required to copy over
         # the reference from the instance to the new plugin.
         self.picture = oldinstance.picture
 
+    @measured('get_size')
     def get_size(self, width=None, height=None):
         crop = self.use_crop
         upscale = self.use_upscale
@@ -247,24 +378,25 @@ class AbstractPicture(CMSPlugin):
             width = self.width
             height = self.height
 
-        if self.picture:
+        if self.source_size:
+            source_width, source_height = self.source_size
             # calculate height when not given according to the
             # golden ratio or fallback to the picture size
             if crop:
                 if not height and width:
-                    if self.picture.width > self.picture.height:
+                    if source_width > source_height:
                         height = width / PICTURE_RATIO
                     else:
                         height = width * PICTURE_RATIO
 
                 elif not width and height:
-                    if self.picture.width > self.picture.height:
+                    if source_width > source_height:
                         width = height * PICTURE_RATIO
                     else:
                         width = height / PICTURE_RATIO
 
-            width = width or self.picture.width
-            height = height or self.picture.height
+            width = width or source_width
+            height = height or source_height
 
         # ensure width and height are int
         width = int(width) if width is not None else width
@@ -277,6 +409,49 @@ class AbstractPicture(CMSPlugin):
         }
         return options
 
+    @classmethod
+    def get_sizes(cls, pictures, width=None, height=None):
+        """
+        Returns the ``get_size(width, height)`` results of all pictures of a
+        queryset by primary key, computed in one pass over their values.
+        External pictures use the stored copies or probed sizes, nothing is
+        fetched.
+        """
+        rows = list(pictures.values_list(
+            'pk',
+            'width',
+            'height',
+            'use_automatic_scaling',
+            'use_crop',
+            'use_upscale',
+            'thumbnail_options_id',
+            'thumbnail_options__width',
+            'thumbnail_options__height',
+            'thumbnail_options__crop',
+            'thumbnail_options__upscale',
+            'external_picture',
+            'picture_id',
+            'picture___width',
+            'picture___height',
+            'picture_orientation',
+        ).iterator(chunk_size=2000))
+        external_sizes = get_external_sizes({row[11] for row in rows if row[11]})
+
+        compact_rows = []
+        for row in rows:
+            external_picture, picture_id, source_width, source_height, orientation = row[11:]
+            if external_picture:
+                source_size = external_sizes.get(external_picture, (None, None))
+            elif not (picture_id and source_width and source_height):
+                # images of unknown size, like ``source_size``
+                source_size = (None, None)
+            elif orientation in TRANSPOSED_ORIENTATIONS:
+                source_size = (source_height, source_width)
+            else:
+                source_size = (source_width, source_height)
+            compact_rows.append(row[:6] + (row[6] is not None,) + row[7:11] + source_size)
+        return compute_sizes(compact_rows, width, height, PICTURE_RATIO)
+
     def get_link(self):
         if self.link_url:
             return self.link_url
@@ -337,65 +512,661 @@ class AbstractPicture(CMSPlugin):
 
     @property
     def is_responsive_image(self):
-        if self.external_picture:
+        if self.external_picture and not is_external_cache_enabled():
             return False
         if self.use_responsive_image == 'inherit':
             return getattr(settings, 'DJANGOCMS_PICTURE_RESPONSIVE_IMAGES', False)
         return self.use_responsive_image == 'yes'
 
     @property
-    def img_srcset_data(self):
-        if not (self.picture and self.is_responsive_image):
+    def is_modern_format_image(self):
+        if self.external_picture and not is_external_cache_enabled():
+            return False
+        if self.use_no_cropping:
+            return False
+        if self.use_modern_formats == 'inherit':
+            return getattr(settings, 'DJANGOCMS_PICTURE_MODERN_IMAGES', False)
+        return self.use_modern_formats == 'yes'
+
+    def get_modern_formats(self):
+        # vector images are never converted
+        if not (self.source_image and self.is_modern_format_image):
+            return []
+        if self.source_image.extension == 'svg':
+            return []
+        return get_modern_image_formats()
+
+    def _get_picture_cache_key(self):
+        # the resolved image data only depends on these values, if any of
+        # them changes the memoized results are discarded
+        return (
+            self.picture_id,
+            self.picture.file.name if self.picture else None,
+            self.picture.subject_location if self.picture else None,
+            self.picture_orientation,
+            self.external_picture,
+            self.width,
+            self.height,
+            self.use_automatic_scaling,
+            self.use_no_cropping,
+            self.use_crop,
+            self.use_upscale,
+            self.thumbnail_options_id,
+            is_external_cache_enabled(),
+            self.is_responsive_image,
+            tuple(get_responsive_image_breakpoints()),
+            tuple(get_responsive_image_densities() or ()),
+            self.is_modern_format_image,
+            tuple(get_modern_image_formats()),
+            is_preview_enabled(),
+            is_immutable_thumbnails_enabled(),
+        )
+
+    def _get_cached(self, name, func, *args):
+        # memoizes ``func(*args)`` on the instance, so the plugin and the
+        # template share a single thumbnail resolution per render
+        key = self._get_picture_cache_key()
+        cache = self.__dict__.get('_picture_cache')
+        if cache is None or cache['key'] != key:
+            cache = self.__dict__['_picture_cache'] = {'key': key}
+        lookup = (name,) + args
+        if lookup not in cache:
+            cache[lookup] = func(*args)
+        return cache[lookup]
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.__dict__.pop('_picture_cache', None)
+        super().refresh_from_db(*args, **kwargs)
+
+    @property
+    def source_image(self):
+        # the image thumbnails are generated from, the filer image or the
+        # local copy of the external picture
+        return self._get_cached('source_image', self._get_source_image)
+
+    def _get_source_image(self):
+        if self.external_picture:
+            if is_external_cache_enabled():
+                return get_external_image(self.external_picture)
             return None
+        return self.picture
 
-        srcset = []
-        thumbnailer = get_thumbnailer(self.picture)
-        picture_options = self.get_size(self.width, self.height)
-        picture_width = picture_options['size'][0]
-        thumbnail_options = {'crop': picture_options['crop']}
-        breakpoints = getattr(
-            settings,
-            'DJANGOCMS_PICTURE_RESPONSIVE_IMAGES_VIEWPORT_BREAKPOINTS',
-            [576, 768, 992],
+    @property
+    def source_size(self):
+        # the (width, height) of the original image, probed for external
+        # pictures without a local copy
+        return self._get_cached('source_size', self._get_source_size)
+
+    def _get_source_size(self):
+        source = self.source_image
+        if source:
+            return get_source_size(source, self.picture_orientation)
+        if self.external_picture and is_probe_enabled():
+            return get_external_dimensions(self.external_picture)
+        return None
+
+    def get_cached_size(self, width=None, height=None):
+        return self._get_cached('size', self.get_size, width, height)
+
+    def get_img_srcset_options(self):
+        # returns the (width, thumbnail options) pairs of the srcset, the
+        # ``img_src`` variant scaled down to each smaller breakpoint
+        if not (self.source_image and self.is_responsive_image):
+            return None
+        if get_responsive_image_densities():
+            return None
+        # pictures without cropping render the source, their srcset scales
+        # it like ``img_src`` would
+        img_src_options = self.get_img_src_options() or VariantSpec.from_size(
+            self.get_cached_size(self.width or 0, self.height or 0),
+            self.source_image.subject_location,
         )
+        source_size = self.source_size
+        if not (source_size and all(source_size)):
+            return []
 
-        for size in filter(lambda x: x < picture_width, breakpoints):
-            thumbnail_options['size'] = (size, size)
-            srcset.append((int(size), thumbnailer.get_thumbnail(thumbnail_options)))
+        # the breakpoints scale the rendered image, which is smaller than the
+        # requested box if that is larger than a source not upscaled
+        width, height = get_thumbnail_dimensions(source_size, **img_src_options)
+        rendered_options = img_src_options.resized((width, height))
+        dimensions = {(width, height)}
+        srcset = []
+        for size in get_responsive_image_breakpoints():
+            if size >= width:
+                continue
+            thumbnail_options = rendered_options.scaled(size / width)
+            # variants resolving to the same output share a thumbnail
+            thumbnail_dimensions = get_thumbnail_dimensions(source_size, **thumbnail_options)
+            if thumbnail_dimensions in dimensions:
+                continue
+            dimensions.add(thumbnail_dimensions)
+            srcset.append((thumbnail_dimensions[0], thumbnail_options))
 
         return srcset
 
+    def get_img_density_options(self):
+        # returns the (density, thumbnail options) pairs of the srcset in
+        # density mode, the 1x entry is ``img_src`` itself
+        densities = get_responsive_image_densities()
+        source = self.source_image
+        if not (densities and source and self.is_responsive_image):
+            return None
+        img_src_options = self.get_img_src_options()
+        source_size = self.source_size
+        if not (img_src_options and source_size):
+            return None
+
+        width, height = get_thumbnail_dimensions(source_size, **img_src_options)
+        # never ask for more pixels than the source provides
+        max_density = round(min(source_size[0] / width, source_size[1] / height), 2)
+
+        srcset = []
+        for density in sorted(densities):
+            density = min(density, max_density)
+            if density <= 1 or srcset and density <= srcset[-1][0]:
+                continue
+            srcset.append((density, img_src_options.scaled(density)))
+
+        return srcset
+
+    def get_img_src_options(self):
+        # returns the ``VariantSpec`` of ``img_src`` or None if no
+        # thumbnail is rendered
+        if not self.source_image or self.use_no_cropping:
+            return None
+
+        picture_options = self.get_cached_size(
+            width=self.width or 0,
+            height=self.height or 0,
+        )
+        return VariantSpec.from_size(picture_options, self.source_image.subject_location)
+
+    def get_thumbnail_variants(self):
+        # all (thumbnail options, extension) pairs the plugin requests when
+        # rendering, the extension is None for the default format
+        variants = []
+        img_src_options = self.get_img_src_options()
+        if img_src_options:
+            variants.append(img_src_options)
+        for size, thumbnail_options in self.get_img_srcset_options() or []:
+            variants.append(thumbnail_options)
+        for density, thumbnail_options in self.get_img_density_options() or []:
+            variants.append(thumbnail_options)
+        extensions = [None] + self.get_modern_formats()
+        return [
+            (thumbnail_options, extension)
+            for extension in extensions
+            for thumbnail_options in variants
+        ]
+
+    @property
+    def img_sources(self):
+        return self._get_cached('img_sources', self._get_img_sources)
+
+    def _get_img_sources(self):
+        # the ``<source>`` elements rendered for modern image formats, each
+        # one provides the img_src and srcset thumbnails in its format
+        img_src_options = self.get_img_src_options()
+        if not img_src_options:
+            return []
+
+        sources = []
+        for extension in self.get_modern_formats():
+            thumbnails = self.get_variant_thumbnails(extension)
+            sources.append({
+                'type': MODERN_FORMAT_TYPES.get(extension, 'image/{}'.format(extension)),
+                'src': thumbnails['src'],
+                'srcset': thumbnails['srcset'] or [],
+                'densities': thumbnails['densities'] or [],
+            })
+        return sources
+
+    def get_variant_thumbnails(self, extension=None):
+        # the img_src, srcset and density thumbnails in the format of
+        # ``extension``. The thumbnails of all formats a render needs are
+        # resolved together, missing ones share a single decode of the source
+        thumbnails = self._get_cached(
+            'variant_thumbnails', self._get_variant_thumbnails, self.get_render_extensions(),
+        )
+        if extension not in thumbnails:
+            thumbnails = self._get_cached('variant_thumbnails', self._get_variant_thumbnails, (extension,))
+        return thumbnails[extension]
+
+    def get_render_extensions(self):
+        # the formats of the thumbnails resolved when rendering, the default
+        # one is read from an up to date manifest instead
+        extensions = tuple(self.get_modern_formats())
+        if not self.get_variant_manifest():
+            extensions = (None,) + extensions
+        return extensions
+
+    def _get_variant_thumbnails(self, extensions):
+        img_src_options = self.get_img_src_options()
+        srcset_options = self.get_img_srcset_options()
+        density_options = self.get_img_density_options()
+        options = [img_src_options] if img_src_options else []
+        options += [
+            thumbnail_options
+            for descriptor, thumbnail_options in (srcset_options or []) + (density_options or [])
+        ]
+        variants = [
+            (thumbnail_options, extension)
+            for extension in extensions
+            for thumbnail_options in options
+        ]
+
+        thumbnails = iter(get_thumbnails(self.source_image, variants, self.source_size) if variants else [])
+        results = {}
+        for extension in extensions:
+            results[extension] = {
+                'src': next(thumbnails) if img_src_options else None,
+                'srcset': None if srcset_options is None else [
+                    (size, next(thumbnails)) for size, thumbnail_options in srcset_options
+                ],
+                'densities': None if density_options is None else [
+                    (density, next(thumbnails)) for density, thumbnail_options in density_options
+                ],
+            }
+        return results
+
+    def _get_manifest_thumbnails(self, name):
+        # returns the (descriptor, thumbnail) pairs stored in the manifest
+        # under ``name`` or False if there is no up to date manifest
+        manifest = self.get_variant_manifest()
+        if not manifest:
+            return False
+        if manifest.get(name) is None:
+            return None
+        return [
+            (descriptor, StoredThumbnail(**thumbnail))
+            for descriptor, thumbnail in manifest[name]
+        ]
+
+    @property
+    def img_srcset_data(self):
+        return self._get_cached('img_srcset_data', self._get_img_srcset_data)
+
+    @measured('img_srcset_data')
+    def _get_img_srcset_data(self):
+        srcset = self._get_manifest_thumbnails('srcset')
+        if srcset is not False:
+            return srcset
+
+        return self.get_variant_thumbnails()['srcset']
+
+    @property
+    def img_density_srcset_data(self):
+        return self._get_cached('img_density_srcset_data', self._get_img_density_srcset_data)
+
+    def _get_img_density_srcset_data(self):
+        srcset = self._get_manifest_thumbnails('densities')
+        if srcset is not False:
+            return srcset
+
+        return self.get_variant_thumbnails()['densities']
+
     @property
     def img_src(self):
+        return self._get_cached('img_src', self._get_img_src)
+
+    def get_img_src_thumbnail(self):
+        # returns the thumbnail rendered as ``img_src`` or None if the
+        # source is used directly
+        return self._get_cached('img_src_thumbnail', self._get_img_src_thumbnail)
+
+    def _get_img_src_thumbnail(self):
+        manifest = self.get_variant_manifest()
+        if manifest and manifest['img_src']:
+            return StoredThumbnail(**manifest['img_src'])
+
+        return self.get_variant_thumbnails()['src']
+
+    @measured('img_src')
+    def _get_img_src(self):
         # we want the external picture to take priority by design
         # please open a ticket if you disagree for an open discussion
-        if self.external_picture:
+        # external pictures are linked directly unless a local copy exists
+        source = self.source_image
+        if self.external_picture and not source:
             return self.external_picture
         # picture can be empty, for example when the image is removed from filer
         # in this case we want to return an empty string to avoid #69
-        elif not self.picture:
+        elif not source:
             return ''
         # return the original, unmodified picture
         elif self.use_no_cropping:
-            return self.picture.url
+            return source.url
 
-        picture_options = self.get_size(
-            width=self.width or 0,
-            height=self.height or 0,
-        )
+        return self.get_img_src_thumbnail().url
+
+    @property
+    def img_dimensions(self):
+        return self._get_cached('img_dimensions', self._get_img_dimensions)
+
+    def _get_img_dimensions(self):
+        # the (width, height) of the image rendered as ``img_src``, taken
+        # from the manifest or the stored dimensions of the image rotated by
+        # its EXIF orientation, None if unknown
+        source = self.source_image
+        if self.external_picture and not source:
+            dimensions = (self.width, self.height)
+            if not all(dimensions) and self.source_size:
+                # the probed size scaled to the given width or height
+                dimensions = get_thumbnail_dimensions(
+                    self.source_size, dimensions, upscale=True,
+                ) if any(dimensions) else self.source_size
+        elif not source:
+            return None
+        elif self.use_no_cropping:
+            dimensions = self.source_size
+        else:
+            manifest = self.get_variant_manifest()
+            if manifest and manifest['img_src']:
+                dimensions = (manifest['img_src']['width'], manifest['img_src']['height'])
+            elif self.source_size:
+                dimensions = get_thumbnail_dimensions(self.source_size, **self.get_img_src_options())
+            else:
+                return None
+        if not (dimensions and all(dimensions)):
+            return None
+        return tuple(int(value) for value in dimensions)
+
+    def has_pending_thumbnails(self):
+        # true while thumbnails are generated in the background
+        thumbnails = [thumbnail for size, thumbnail in self.img_srcset_data or []]
+        thumbnails += [thumbnail for density, thumbnail in self.img_density_srcset_data or []]
+        thumbnails.append(self.get_img_src_thumbnail())
+        for source in self.img_sources:
+            thumbnails.append(source['src'])
+            thumbnails += [thumbnail for size, thumbnail in source['srcset']]
+            thumbnails += [thumbnail for density, thumbnail in source['densities']]
+        return any(isinstance(thumbnail, PendingThumbnail) for thumbnail in thumbnails)
+
+    @property
+    def preview(self):
+        return self._get_cached('preview', self._get_preview)
+
+    def _get_preview(self):
+        # a blurred preview and the dominant color of the image, shown
+        # while the image loads
+        if not is_preview_enabled() or not self.source_image:
+            return None
+        manifest = self.get_variant_manifest()
+        if manifest and manifest.get('preview'):
+            return manifest['preview']
+        try:
+            return get_preview(self.source_image)
+        except (OSError, ValueError):
+            return None
+
+    def get_variant_manifest_key(self):
+        # identifies the source file and every requested variant, the
+        # manifest is outdated as soon as one of them changes
+        source = self.source_image
+        if not source:
+            return None
+        parts = [
+            source.sha1,
+            source.file.name,
+            self.source_size,
+            self.get_img_src_options(),
+            self.get_img_srcset_options(),
+            self.get_img_density_options(),
+            is_immutable_thumbnails_enabled(),
+        ]
+        return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    def get_variant_manifest(self):
+        # returns the stored manifest if it is enabled and up to date
+        if not (is_variant_manifest_enabled() and self.variant_manifest):
+            return None
+        if self.variant_manifest.get('key') != self.get_variant_manifest_key():
+            return None
+        return self.variant_manifest
+
+    def build_variant_manifest(self):
+        """
+        Resolves the thumbnails of ``img_src`` and the srcset, returns None
+        while thumbnails are still generated in the background.
+        """
+        key = self.get_variant_manifest_key()
+        if key is None:
+            return None
 
-        thumbnail_options = {
-            'size': picture_options['size'],
-            'crop': picture_options['crop'],
-            'upscale': picture_options['upscale'],
-            'subject_location': self.picture.subject_location,
+        def describe(thumbnail):
+            return {
+                'url': thumbnail.url,
+                'width': thumbnail.width,
+                'height': thumbnail.height,
+            }
+
+        def describe_all(pairs):
+            if pairs is None:
+                return None
+            return [[descriptor, describe(thumbnail)] for descriptor, thumbnail in pairs]
+
+        variant_thumbnails = self._get_variant_thumbnails((None,))[None]
+        img_src = variant_thumbnails['src']
+        srcset = variant_thumbnails['srcset']
+        densities = variant_thumbnails['densities']
+
+        thumbnails = [img_src] + [
+            thumbnail for descriptor, thumbnail in (srcset or []) + (densities or [])
+        ]
+        if any(isinstance(thumbnail, PendingThumbnail) for thumbnail in thumbnails):
+            return None
+
+        return {
+            'key': key,
+            'img_src': describe(img_src) if img_src else None,
+            'srcset': describe_all(srcset),
+            'densities': describe_all(densities),
+            'preview': self._get_preview(),
         }
 
-        thumbnailer = get_thumbnailer(self.picture)
-        return thumbnailer.get_thumbnail(thumbnail_options).url
+    def refresh_variant_manifest(self, commit=True, force=False):
+        # rebuilds the manifest if it is missing or outdated, returns
+        # whether it changed
+        if not force and self.get_variant_manifest():
+            return False
+        try:
+            manifest = self.build_variant_manifest()
+        except (EasyThumbnailsError, OSError):
+            manifest = None
+        if manifest == self.variant_manifest:
+            return False
+        self.variant_manifest = manifest
+        if commit:
+            # avoid ``save`` to leave the plugin's change date untouched
+            type(self).objects.filter(pk=self.pk).update(variant_manifest=manifest)
+        return True
+
+
+def prefetch_pictures(instances):
+    """
+    Loads the images, thumbnail options and linked pages of the given
+    picture plugins in a constant number of queries.
+    """
+    lookups = ['picture', 'thumbnail_options', 'link_page']
+    # django CMS 4 resolves page urls through the PageUrl model
+    if hasattr(Page, 'urls'):
+        lookups.append('link_page__urls')
+    prefetch_related_objects(
+        [instance for instance in instances if isinstance(instance, AbstractPicture)],
+        *lookups,
+    )
+
+
+def prefetch_external_images(instances):
+    """
+    Uses the existing local copies of the external pictures of the given
+    picture plugins as their source images, without fetching or
+    revalidating any of them.
+    """
+    instances = [
+        instance for instance in instances
+        if isinstance(instance, AbstractPicture) and instance.external_picture
+    ]
+    copies = {}
+    if instances and is_external_cache_enabled():
+        copies = {
+            external_image.external_url: external_image
+            for external_image in ExternalImage.objects.filter(
+                external_url__in={instance.external_picture for instance in instances},
+                file__gt='',
+            )
+        }
+    for instance in instances:
+        copy = copies.get(instance.external_picture)
+        instance._get_cached('source_image', lambda copy=copy: copy)
 
 
 class Picture(AbstractPicture):
 
     class Meta:
         abstract = False
+
+
+class ExternalImage(models.Model):
+    """
+    The local copy of an external picture, provides the attributes of filer
+    images used to generate thumbnails.
+    """
+    external_url = models.URLField(
+        verbose_name=_('External URL'),
+        unique=True,
+        max_length=255,
+    )
+    file = models.FileField(
+        verbose_name=_('File'),
+        upload_to='external_pictures',
+        blank=True,
+        max_length=255,
+    )
+    sha1 = models.CharField(
+        verbose_name=_('Checksum'),
+        blank=True,
+        max_length=40,
+    )
+    width = models.PositiveIntegerField(
+        verbose_name=_('Width'),
+        blank=True,
+        null=True,
+        help_text=_('Rotated by the EXIF orientation of the image.'),
+    )
+    height = models.PositiveIntegerField(
+        verbose_name=_('Height'),
+        blank=True,
+        null=True,
+        help_text=_('Rotated by the EXIF orientation of the image.'),
+    )
+    etag = models.CharField(
+        verbose_name=_('ETag'),
+        blank=True,
+        max_length=255,
+    )
+    last_modified = models.CharField(
+        verbose_name=_('Last modified'),
+        blank=True,
+        max_length=64,
+    )
+    fetched_at = models.DateTimeField(
+        verbose_name=_('Fetched at'),
+        blank=True,
+        null=True,
+    )
+    format = models.CharField(
+        verbose_name=_('Format'),
+        blank=True,
+        max_length=16,
+    )
+    probed_at = models.DateTimeField(
+        verbose_name=_('Probed at'),
+        blank=True,
+        null=True,
+    )
+
+    # external images have no focal point
+    subject_location = ''
+
+    class Meta:
+        verbose_name = _('External image')
+        verbose_name_plural = _('External images')
+
+    def __str__(self):
+        return self.external_url
+
+    @property
+    def url(self):
+        return self.file.url
+
+    @property
+    def extension(self):
+        return self.file.name.rsplit('.', 1)[-1].lower()
+
+    @property
+    def oriented_size(self):
+        # the stored dimensions are rotated by the EXIF orientation already
+        if self.width and self.height:
+            return (self.width, self.height)
+        return None
+
+    @property
+    def easy_thumbnails_thumbnailer(self):
+        return get_thumbnailer(self.file)
+
+
+def get_external_image(url):
+    """
+    Returns the local copy of the external picture at ``url`` or None if it
+    was not fetched yet. Outdated copies are revalidated, in async mode in
+    the background.
+    """
+    external_image, created = ExternalImage.objects.get_or_create(external_url=url)
+    if is_outdated(external_image.fetched_at):
+        if is_async_enabled():
+            pk = external_image.pk
+            get_backend().submit(
+                'external:{}'.format(url),
+                lambda: refresh_external_image(ExternalImage.objects.get(pk=pk)),
+            )
+        else:
+            refresh_external_image(external_image)
+    return external_image if external_image.file else None
+
+
+def get_external_dimensions(url):
+    """
+    Returns the probed (width, height) of the external picture at ``url`` or
+    None if unknown. Outdated dimensions are probed by the thumbnail
+    backend, never during the render.
+    """
+    external_image, created = ExternalImage.objects.get_or_create(external_url=url)
+    if is_outdated(external_image.probed_at):
+        pk = external_image.pk
+        get_backend().submit(
+            'probe:{}'.format(url),
+            lambda: probe_external_image(ExternalImage.objects.get(pk=pk)),
+        )
+    if external_image.width and external_image.height:
+        return (external_image.width, external_image.height)
+    return None
+
+
+def get_external_sizes(urls, chunk_size=500):
+    # returns the stored (width, height) of the external pictures at
+    # ``urls``, like ``AbstractPicture.source_size`` finds them
+    if is_external_cache_enabled():
+        queryset = ExternalImage.objects.exclude(file='')
+    elif is_probe_enabled():
+        queryset = ExternalImage.objects.filter(width__isnull=False, height__isnull=False)
+    else:
+        return {}
+    urls = list(urls)
+    sizes = {}
+    for index in range(0, len(urls), chunk_size):
+        for url, width, height in queryset.filter(
+            external_url__in=urls[index:index + chunk_size],
+        ).values_list('external_url', 'width', 'height'):
+            sizes[url] = (width, height)
+    return sizes
@@ -0,0 +1,75 @@
+"""
+A django-debug-toolbar panel listing the measurements of the pictures
+rendered in a request, enable it with::
+
+    DEBUG_TOOLBAR_PANELS = [
+        ...
+        'djangocms_picture.panels.PicturePanel',
+    ]
+"""
+from contextvars import ContextVar
+
+from debug_toolbar.panels import Panel
+from django.utils.translation import gettext_lazy as _
+from django.utils.translation import ngettext
+
+from .instrumentation import picture_measured
+
+# the panel of the request being processed, measurements of concurrent
+# requests and background threads are sent to the same signal
+current_panel = ContextVar('djangocms_picture_panel', default=None)
+
+
+class PicturePanel(Panel):
+    title = _('Pictures')
+    template = 'djangocms_picture/debug_toolbar/panel.html'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.measurements = []
+
+    @property
+    def nav_subtitle(self):
+        thumbnails = [
+            measurement for measurement in self.measurements
+            if measurement['operation'] == 'get_thumbnail'
+        ]
+        generated = len([measurement for measurement in thumbnails if not measurement['cache_hit']])
+        return ngettext(
+            '%(count)d thumbnail, %(generated)d generated',
+            '%(count)d thumbnails, %(generated)d generated',
+            len(thumbnails),
+        ) % {'count': len(thumbnails), 'generated': generated}
+
+    def record(self, sender, operation, duration, queries, **kwargs):
+        if current_panel.get() is not self:
+            return
+        self.measurements.append({
+            'operation': operation,
+            'duration': duration * 1000,
+            'queries': queries,
+            'cache_hit': kwargs.get('cache_hit'),
+            'pending': kwargs.get('pending', False),
+            'bytes': kwargs.get('bytes'),
+            'instance': str(kwargs.get('instance', '')),
+        })
+
+    def enable_instrumentation(self):
+        current_panel.set(self)
+        picture_measured.connect(self.record)
+
+    def disable_instrumentation(self):
+        picture_measured.disconnect(self.record)
+        current_panel.set(None)
+
+    def generate_stats(self, request, response):
+        totals = {}
+        for measurement in self.measurements:
+            total = totals.setdefault(measurement['operation'], {'count': 0, 'duration': 0, 'queries': 0})
+            total['count'] += 1
+            total['duration'] += measurement['duration']
+            total['queries'] += measurement['queries']
+        self.record_stats({
+            'measurements': self.measurements,
+            'totals': sorted(totals.items()),
+        })
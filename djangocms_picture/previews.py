@@ -0,0 +1,90 @@
+"""
+Tiny blurred previews and dominant colors shown while the actual image
+loads, computed once per image file and kept in the cache.
+"""
+import base64
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import caches
+from easy_thumbnails.utils import is_transparent
+from PIL import Image as PILImage
+from PIL import ImageFilter, ImageOps
+
+from .thumbnails import get_backend, is_async_enabled
+
+MISSING = object()
+
+
+def is_preview_enabled():
+    return getattr(settings, 'DJANGOCMS_PICTURE_PREVIEWS', False)
+
+
+def get_preview_size():
+    return getattr(settings, 'DJANGOCMS_PICTURE_PREVIEW_SIZE', 16)
+
+
+def get_preview_cache():
+    return caches[getattr(settings, 'DJANGOCMS_PICTURE_PREVIEW_CACHE_ALIAS', 'default')]
+
+
+def get_preview_cache_key(image):
+    # the checksum changes with the file content, the preview never expires
+    return 'djangocms_picture:preview:{}:{}'.format(image.sha1, get_preview_size())
+
+
+def generate_preview(file):
+    """
+    Returns a dict with a base64 encoded, blurred preview of ``file`` as
+    ``src`` and its dominant color as ``color``, or None for transparent
+    images the preview would show through.
+    """
+    size = get_preview_size()
+    with PILImage.open(file) as image:
+        if is_transparent(image):
+            return None
+        # let the JPEG decoder skip most of the pixels
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image.thumbnail((size, size))
+    image = image.filter(ImageFilter.GaussianBlur(1))
+    red, green, blue = image.resize((1, 1), PILImage.Resampling.BOX).getpixel((0, 0))
+
+    data = BytesIO()
+    image.save(data, format='JPEG', quality=40)
+    return {
+        'src': 'data:image/jpeg;base64,{}'.format(base64.b64encode(data.getvalue()).decode('ascii')),
+        'color': '#{:02x}{:02x}{:02x}'.format(red, green, blue),
+        'width': image.width,
+        'height': image.height,
+    }
+
+
+def build_preview(image):
+    cache = get_preview_cache()
+    key = get_preview_cache_key(image)
+    # images without a preview are cached as well
+    preview = cache.get(key, MISSING)
+    if preview is MISSING:
+        with image.file.open('rb') as file:
+            preview = generate_preview(file)
+        cache.set(key, preview, None)
+    return preview
+
+
+def get_preview(image):
+    """
+    Returns the preview of the filer ``image``, in async mode a missing
+    preview is queued and None returned instead.
+    """
+    if image.extension == 'svg':
+        return None
+    if not is_async_enabled():
+        return build_preview(image)
+
+    key = get_preview_cache_key(image)
+    preview = get_preview_cache().get(key, MISSING)
+    if preview is MISSING:
+        get_backend().submit(key, lambda: build_preview(image))
+        return None
+    return preview
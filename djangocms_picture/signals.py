@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .models import Picture, is_variant_manifest_enabled
+from .thumbnails import (
+    generate_missing_thumbnails,
+    get_backend,
+    get_thumbnail_cache,
+    is_async_enabled,
+    read_orientation,
+)
+
+
+def is_eager_thumbnails_enabled():
+    return getattr(settings, 'DJANGOCMS_PICTURE_EAGER_THUMBNAILS', False)
+
+
+def refresh_variant_manifests(image_pk):
+    queryset = Picture.objects.filter(picture_id=image_pk).select_related('picture', 'thumbnail_options')
+    for instance in queryset:
+        instance.refresh_variant_manifest()
+
+
+def refresh_orientations(image):
+    # the pictures showing the image store its orientation, the file of an
+    # image no picture shows is not read
+    queryset = Picture.objects.filter(picture_id=image.pk)
+    if queryset.exists():
+        queryset.update(picture_orientation=read_orientation(image))
+
+
+def warm_image_thumbnails(image_pk):
+    # generates the missing thumbnails of all pictures showing the image,
+    # variants requested by several pictures are generated once
+    queryset = Picture.objects.filter(picture_id=image_pk).select_related('picture', 'thumbnail_options')
+    image = None
+    variants = []
+    for instance in queryset:
+        image = instance.picture
+        variants.extend(instance.get_thumbnail_variants())
+    if not variants:
+        return 0
+    return generate_missing_thumbnails(image, variants)
+
+
+def image_saving(sender, instance, **kwargs):
+    # remembers the checksum of a replaced file, its thumbnails are
+    # forgotten once the image is saved
+    if get_thumbnail_cache() is not None and instance.pk:
+        instance._djangocms_picture_sha1 = (
+            sender.objects.filter(pk=instance.pk).values_list('sha1', flat=True).first()
+        )
+
+
+def forget_thumbnails(instance):
+    cache = get_thumbnail_cache()
+    if cache is None:
+        return
+    cache.invalidate(instance.sha1)
+    previous_sha1 = getattr(instance, '_djangocms_picture_sha1', None)
+    if previous_sha1 and previous_sha1 != instance.sha1:
+        cache.invalidate(previous_sha1)
+
+
+def image_deleted(sender, instance, **kwargs):
+    forget_thumbnails(instance)
+
+
+def image_saved(sender, instance, **kwargs):
+    forget_thumbnails(instance)
+    refresh_orientations(instance)
+
+    # uploading or replacing an image generates the thumbnails of the
+    # pictures showing it in the background, before the first visitor asks.
+    # Saving an image several times queues a single job.
+    if is_eager_thumbnails_enabled():
+        transaction.on_commit(lambda: get_backend().submit(
+            'eager:{}'.format(instance.pk),
+            lambda: warm_image_thumbnails(instance.pk),
+        ))
+
+    # the manifests of pictures showing a replaced or re-cropped image are
+    # outdated, only the ones that changed are rebuilt
+    if not is_variant_manifest_enabled():
+        return
+    if is_async_enabled():
+        get_backend().submit(
+            'manifest:{}'.format(instance.pk),
+            lambda: refresh_variant_manifests(instance.pk),
+        )
+    else:
+        refresh_variant_manifests(instance.pk)
+
+
+image_model = Picture._meta.get_field('picture').related_model
+pre_save.connect(image_saving, sender=image_model, dispatch_uid='djangocms_picture_image_saving')
+post_save.connect(image_saved, sender=image_model, dispatch_uid='djangocms_picture_image_saved')
+post_delete.connect(image_deleted, sender=image_model, dispatch_uid='djangocms_picture_image_deleted')
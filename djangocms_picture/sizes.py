@@ -0,0 +1,155 @@
+"""
+Computes the size options of many pictures in one pass, with the same
+results as ``AbstractPicture.get_size``. NumPy is used if it is installed.
+"""
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+# the columns of the rows passed to ``compute_sizes``, the source size is
+# None for pictures without an image of known size
+ROW_FIELDS = (
+    'pk',
+    'width',
+    'height',
+    'use_automatic_scaling',
+    'use_crop',
+    'use_upscale',
+    'has_thumbnail_options',
+    'thumbnail_options_width',
+    'thumbnail_options_height',
+    'thumbnail_options_crop',
+    'thumbnail_options_upscale',
+    'source_width',
+    'source_height',
+)
+
+
+def compute_size(row, width, height, ratio):
+    (
+        pk, picture_width, picture_height, use_automatic_scaling, crop, upscale,
+        has_thumbnail_options, options_width, options_height, options_crop, options_upscale,
+        source_width, source_height,
+    ) = row
+    if has_thumbnail_options:
+        width, height = options_width, options_height
+        crop, upscale = options_crop, options_upscale
+    elif not use_automatic_scaling:
+        width, height = picture_width, picture_height
+
+    if source_width is not None:
+        if crop:
+            if not height and width:
+                if source_width > source_height:
+                    height = width / ratio
+                else:
+                    height = width * ratio
+            elif not width and height:
+                if source_width > source_height:
+                    width = height * ratio
+                else:
+                    width = height / ratio
+        width = width or source_width
+        height = height or source_height
+
+    return {
+        'size': (
+            int(width) if width is not None else width,
+            int(height) if height is not None else height,
+        ),
+        'crop': crop,
+        'upscale': upscale,
+    }
+
+
+def compute_sizes_python(rows, width, height, ratio):
+    return {row[0]: compute_size(row, width, height, ratio) for row in rows}
+
+
+def compute_sizes_numpy(rows, width, height, ratio):
+    columns = list(zip(*rows))
+
+    def floats(values):
+        # None is kept apart from 0 as NaN
+        return numpy.array([numpy.nan if value is None else value for value in values], dtype=float)
+
+    def booleans(values):
+        return numpy.array([bool(value) for value in values], dtype=bool)
+
+    def scalar(value):
+        return numpy.nan if value is None else float(value)
+
+    def is_set(values):
+        return ~numpy.isnan(values) & (values != 0)
+
+    has_thumbnail_options = booleans(columns[6])
+    use_automatic_scaling = booleans(columns[3])
+    widths = numpy.where(
+        has_thumbnail_options,
+        floats(columns[7]),
+        numpy.where(use_automatic_scaling, scalar(width), floats(columns[1])),
+    )
+    heights = numpy.where(
+        has_thumbnail_options,
+        floats(columns[8]),
+        numpy.where(use_automatic_scaling, scalar(height), floats(columns[2])),
+    )
+    crops = [
+        options_crop if has_options else crop
+        for has_options, crop, options_crop in zip(columns[6], columns[4], columns[9])
+    ]
+    upscales = [
+        options_upscale if has_options else upscale
+        for has_options, upscale, options_upscale in zip(columns[6], columns[5], columns[10])
+    ]
+
+    source_widths = floats(columns[11])
+    source_heights = floats(columns[12])
+    has_source = ~numpy.isnan(source_widths)
+    landscape = source_widths > source_heights
+    cropped = has_source & booleans(crops)
+
+    # calculate the missing side according to the golden ratio
+    missing_height = cropped & is_set(widths) & ~is_set(heights)
+    missing_width = cropped & ~is_set(widths) & is_set(heights)
+    heights = numpy.where(
+        missing_height,
+        numpy.where(landscape, widths / ratio, widths * ratio),
+        heights,
+    )
+    widths = numpy.where(
+        missing_width,
+        numpy.where(landscape, heights * ratio, heights / ratio),
+        widths,
+    )
+    widths = numpy.where(has_source & ~is_set(widths), source_widths, widths)
+    heights = numpy.where(has_source & ~is_set(heights), source_heights, heights)
+
+    sizes = {}
+    for pk, width, height, crop, upscale in zip(
+        columns[0], numpy.trunc(widths).tolist(), numpy.trunc(heights).tolist(), crops, upscales,
+    ):
+        sizes[pk] = {
+            'size': (
+                None if width != width else int(width),
+                None if height != height else int(height),
+            ),
+            'crop': crop,
+            'upscale': upscale,
+        }
+    return sizes
+
+
+def compute_sizes(rows, width=None, height=None, ratio=1.6180):
+    """
+    Returns the size options of ``rows`` by primary key, see ``ROW_FIELDS``
+    for their columns.
+    """
+    rows = list(rows)
+    if not rows:
+        return {}
+    if numpy is not None:
+        return compute_sizes_numpy(rows, width, height, ratio)
+    return compute_sizes_python(rows, width, height, ratio)
@@ -0,0 +1,950 @@
+"""
+Resolves the thumbnails used by the picture plugin and optionally moves
+their generation out of the request into a background backend.
+"""
+import hashlib
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.utils.module_loading import import_string
+from easy_thumbnails import engine, source_generators, utils
+from easy_thumbnails.conf import settings as thumbnail_settings
+from easy_thumbnails.exceptions import InvalidImageFormatError
+from easy_thumbnails.files import ThumbnailFile, get_thumbnailer
+from filer import settings as filer_settings
+from PIL import ExifTags, ImageFile
+from PIL import Image as PILImage
+
+from .instrumentation import measure
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# transparent 1x1 gif, used while a thumbnail is generated in the background
+PLACEHOLDER_URL = 'data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7'
+
+
+def is_async_enabled():
+    return getattr(settings, 'DJANGOCMS_PICTURE_THUMBNAIL_ASYNC', False)
+
+
+# "original" renders the source image, "thumbnail" the url the thumbnail
+# will be stored at and "placeholder" a transparent pixel
+def get_async_fallback():
+    return getattr(settings, 'DJANGOCMS_PICTURE_THUMBNAIL_ASYNC_FALLBACK', 'original')
+
+
+class BaseThumbnailBackend:
+    """
+    Runs thumbnail generation jobs, ``key`` identifies the thumbnail so the
+    same job is not queued twice.
+    """
+
+    def submit(self, key, func):
+        raise NotImplementedError
+
+
+class ThreadPoolBackend(BaseThumbnailBackend):
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'DJANGOCMS_PICTURE_THUMBNAIL_WORKERS', None),
+            thread_name_prefix='djangocms_picture',
+        )
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def submit(self, key, func):
+        with self.lock:
+            if key in self.pending:
+                return
+            self.pending.add(key)
+        self.executor.submit(self.run, key, func)
+
+    def run(self, key, func):
+        try:
+            func()
+        except Exception:
+            logger.exception('Could not generate thumbnail %s', key)
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+            # database connections are per thread, do not leak them
+            connections.close_all()
+
+
+class LocalBackend(BaseThumbnailBackend):
+    """
+    Keeps the jobs in an in-process queue until ``run`` is called,
+    useful for tests.
+    """
+
+    def __init__(self):
+        self.queue = OrderedDict()
+
+    def submit(self, key, func):
+        self.queue.setdefault(key, func)
+
+    def run(self):
+        while self.queue:
+            key, func = self.queue.popitem(last=False)
+            func()
+
+
+@lru_cache(maxsize=None)
+def load_backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    return load_backend(getattr(
+        settings,
+        'DJANGOCMS_PICTURE_THUMBNAIL_BACKEND',
+        'djangocms_picture.thumbnails.ThreadPoolBackend',
+    ))
+
+
+class BaseThumbnailLock:
+    """
+    Makes sure a thumbnail is generated by a single worker at a time,
+    ``key`` identifies the thumbnail. ``acquire`` waits up to ``timeout``
+    seconds and returns a handle to pass to ``release``, or None if the
+    lock is still held by someone else.
+    """
+    poll_interval = 0.05
+
+    def acquire(self, key, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            handle = self.try_acquire(key)
+            if handle is not None:
+                return handle
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def get_lock_key(self, key):
+        # identifies the lock guarding ``key``, several keys may share one
+        return key
+
+    def try_acquire(self, key):
+        raise NotImplementedError
+
+    def release(self, handle):
+        raise NotImplementedError
+
+
+class FileLock(BaseThumbnailLock):
+    """
+    Locks files in ``DJANGOCMS_PICTURE_THUMBNAIL_LOCK_DIR``, which protects
+    the processes of a single host. The thumbnails are spread over
+    ``DJANGOCMS_PICTURE_THUMBNAIL_LOCK_FILES`` lock files, so their number
+    stays fixed.
+    """
+
+    def __init__(self):
+        if fcntl is None:
+            raise ImproperlyConfigured('FileLock requires fcntl, use CacheLock on this platform.')
+        self.directory = getattr(
+            settings,
+            'DJANGOCMS_PICTURE_THUMBNAIL_LOCK_DIR',
+            os.path.join(tempfile.gettempdir(), 'djangocms_picture_locks'),
+        )
+        self.files = getattr(settings, 'DJANGOCMS_PICTURE_THUMBNAIL_LOCK_FILES', 256)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get_lock_key(self, key):
+        return int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16) % self.files
+
+    def try_acquire(self, key):
+        name = '{}.lock'.format(self.get_lock_key(key))
+        file = open(os.path.join(self.directory, name), 'a')
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            return None
+        return file
+
+    def release(self, handle):
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        handle.close()
+
+
+class CacheLock(BaseThumbnailLock):
+    """
+    Locks a key in the cache ``DJANGOCMS_PICTURE_THUMBNAIL_LOCK_CACHE_ALIAS``,
+    which protects all hosts sharing the cache. The lock expires after
+    ``DJANGOCMS_PICTURE_THUMBNAIL_LOCK_EXPIRE`` seconds in case its holder
+    dies.
+    """
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'DJANGOCMS_PICTURE_THUMBNAIL_LOCK_CACHE_ALIAS', 'default')]
+        self.expire = getattr(settings, 'DJANGOCMS_PICTURE_THUMBNAIL_LOCK_EXPIRE', 60)
+
+    def try_acquire(self, key):
+        key = 'djangocms_picture:lock:{}'.format(hashlib.sha1(key.encode('utf-8')).hexdigest())
+        token = uuid.uuid4().hex
+        if not self.cache.add(key, token, timeout=self.expire):
+            return None
+        return key, token
+
+    def release(self, handle):
+        key, token = handle
+        # an expired lock may belong to someone else by now
+        if self.cache.get(key) == token:
+            self.cache.delete(key)
+
+
+def get_lock():
+    # returns the lock guarding thumbnail generation or None if disabled
+    path = getattr(settings, 'DJANGOCMS_PICTURE_THUMBNAIL_LOCK', None)
+    return load_backend(path) if path else None
+
+
+# the seconds to wait for a thumbnail generated by someone else
+def get_lock_timeout():
+    return getattr(settings, 'DJANGOCMS_PICTURE_THUMBNAIL_LOCK_TIMEOUT', 10)
+
+
+class PendingThumbnail:
+    """
+    Stands in for a thumbnail that is still being generated.
+    """
+
+    def __init__(self, url):
+        self.url = url
+
+    def __str__(self):
+        return self.url
+
+
+class ThumbnailCache:
+    """
+    A bounded LRU of the (url, width, height) of existing thumbnails, shared
+    by the threads of a process and optionally backed by a Django cache.
+    Keys start with the checksum of the source file.
+    """
+
+    def __init__(self, maxsize, cache_alias=None, timeout=None):
+        self.maxsize = maxsize
+        self.cache = caches[cache_alias] if cache_alias else None
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_cache_key(self, key):
+        return 'djangocms_picture:thumbnail:{}'.format(hashlib.sha1(repr(key).encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.cache is not None:
+            value = self.cache.get(self.get_cache_key(key))
+            if value is not None:
+                self.remember(key, value)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.remember(key, value)
+        if self.cache is not None:
+            self.cache.set(self.get_cache_key(key), value, self.timeout)
+
+    def remember(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, sha1):
+        # forgets the thumbnails of the source file with checksum ``sha1``,
+        # in the shared cache the ones this process knows about
+        with self.lock:
+            keys = [key for key in self.entries if key[0] == sha1]
+            for key in keys:
+                del self.entries[key]
+        if keys and self.cache is not None:
+            self.cache.delete_many([self.get_cache_key(key) for key in keys])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+            }
+
+
+@lru_cache(maxsize=None)
+def load_thumbnail_cache(maxsize, cache_alias, timeout):
+    return ThumbnailCache(maxsize, cache_alias, timeout)
+
+
+def get_thumbnail_cache():
+    # returns the cache of resolved thumbnails or None if disabled
+    maxsize = getattr(settings, 'DJANGOCMS_PICTURE_THUMBNAIL_CACHE_SIZE', 0)
+    if not maxsize:
+        return None
+    return load_thumbnail_cache(
+        maxsize,
+        getattr(settings, 'DJANGOCMS_PICTURE_THUMBNAIL_CACHE_ALIAS', None),
+        getattr(settings, 'DJANGOCMS_PICTURE_THUMBNAIL_CACHE_TIMEOUT', 24 * 60 * 60),
+    )
+
+
+class StoredThumbnail:
+    """
+    A thumbnail resolved earlier, for example read from the variant
+    manifest of a picture.
+    """
+
+    def __init__(self, url, width=None, height=None):
+        self.url = url
+        self.width = width
+        self.height = height
+
+    def __str__(self):
+        return self.url
+
+
+class VariantSpec(dict):
+    """
+    The canonical thumbnail options of a variant of a picture, used for
+    ``img_src`` as well as the srcset so equal requests share a thumbnail.
+    Being a dict it can be passed to easy_thumbnails as is.
+    """
+
+    def __init__(self, size, crop=False, upscale=False, subject_location=''):
+        super().__init__(
+            size=tuple(int(value or 0) for value in size),
+            crop=bool(crop),
+            upscale=bool(upscale),
+            subject_location=subject_location or '',
+        )
+
+    @classmethod
+    def from_size(cls, picture_options, subject_location=''):
+        # ``picture_options`` as returned by ``AbstractPicture.get_size``
+        return cls(
+            picture_options['size'],
+            crop=picture_options['crop'],
+            upscale=picture_options['upscale'],
+            subject_location=subject_location,
+        )
+
+    def resized(self, size):
+        # the same variant with another bounding box
+        return VariantSpec(
+            size,
+            crop=self['crop'],
+            upscale=self['upscale'],
+            subject_location=self['subject_location'],
+        )
+
+    def scaled(self, factor):
+        # the same variant with its bounding box scaled by ``factor``, which
+        # keeps the aspect ratio and the cropped region
+        width, height = self['size']
+        return self.resized((round(width * factor), round(height * factor)))
+
+
+# easy_thumbnails passes the JPEG chroma subsampling as integer, Pillow's
+# AVIF encoder expects it spelled out
+AVIF_SUBSAMPLING = {
+    0: '4:4:4',
+    1: '4:2:2',
+    2: '4:2:0',
+}
+
+
+def render_thumbnail(thumbnailer, thumbnail_options, image, scale=1.0):
+    """
+    A version of ``Thumbnailer.generate_thumbnail`` processing the already
+    decoded ``image``, which is the source reduced by ``scale``. Returns an
+    unsaved ``ThumbnailFile``.
+    """
+    processing_options = thumbnail_options
+    if scale != 1.0 and thumbnail_options.get('subject_location'):
+        processing_options = dict(
+            thumbnail_options,
+            subject_location=scale_subject_location(thumbnail_options['subject_location'], scale),
+        )
+    thumbnail_image = engine.process_image(
+        image, processing_options, thumbnailer.thumbnail_processors)
+    filename = thumbnailer.get_thumbnail_name(
+        thumbnail_options,
+        transparent=utils.is_transparent(thumbnail_image))
+    subsampling = thumbnail_options['subsampling']
+    if os.path.splitext(filename)[1].lower() == '.avif':
+        subsampling = AVIF_SUBSAMPLING.get(subsampling, '4:2:0')
+    data = engine.save_pil_image(
+        thumbnail_image,
+        filename=filename,
+        quality=thumbnail_options['quality'],
+        subsampling=subsampling,
+        keep_icc_profile=thumbnail_options.get('keep_icc_profile', False),
+    ).read()
+
+    thumbnail = ThumbnailFile(
+        filename, file=ContentFile(data), storage=thumbnailer.thumbnail_storage,
+        thumbnail_options=thumbnail_options)
+    thumbnail.image = thumbnail_image
+    thumbnail._committed = False
+    return thumbnail
+
+
+# the EXIF orientations rotating the image by 90 degrees
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# the ``info`` key ``draft_image`` records the size of the source under
+SOURCE_SIZE_INFO = 'djangocms_picture_source_size'
+
+
+def draft_image(source, variants=(), exif_orientation=True, **options):
+    """
+    A version of easy_thumbnails' ``pil_image`` source generator decoding
+    JPEG files at the smallest resolution still large enough for all
+    ``variants`` (normalized thumbnail options), using the scaling of the
+    JPEG decoder. The size of the source is kept in ``image.info``.
+    """
+    if not source:
+        return
+    image = PILImage.open(BytesIO(source.read()))
+    width, height = image.size
+    source_size = (width, height)
+    if image.getexif().get(ExifTags.Base.Orientation) in TRANSPOSED_ORIENTATIONS:
+        source_size = (height, width)
+    if variants and image.format == 'JPEG':
+        scale = max(get_thumbnail_scale(source_size, **variant) for variant in variants)
+        if scale < 1.0:
+            image.draft(image.mode, (math.ceil(width * scale), math.ceil(height * scale)))
+    try:
+        ImageFile.LOAD_TRUNCATED_IMAGES = True
+        image.load()
+    finally:
+        ImageFile.LOAD_TRUNCATED_IMAGES = False
+    image.info[SOURCE_SIZE_INFO] = source_size
+
+    if exif_orientation:
+        image = utils.exif_orientation(image)
+    return image
+
+
+def decode_source(thumbnailer, thumbnail_options, silent_template_exception=False, variants=None):
+    # with ``variants`` a JPEG source is decoded at a reduced resolution,
+    # see ``draft_image``
+    generators = thumbnailer.source_generators
+    if variants:
+        generators = [
+            partial(draft_image, variants=variants)
+            if generator is source_generators.pil_image else generator
+            for generator in generators or [
+                import_string(name) for name in thumbnail_settings.THUMBNAIL_SOURCE_GENERATORS
+            ]
+        ]
+    image = engine.generate_source_image(
+        thumbnailer, thumbnail_options, generators,
+        fail_silently=silent_template_exception)
+    if image is None:
+        msg = "The source file does not appear to be an image: '{name}'"
+        raise InvalidImageFormatError(msg.format(name=thumbnailer.name))
+    return image
+
+
+def generate_avif_thumbnail(thumbnailer, thumbnail_options, silent_template_exception=False):
+    # the AVIF encoder needs the subsampling option spelled out, which
+    # ``render_thumbnail`` takes care of
+    thumbnail_options = thumbnailer.get_options(thumbnail_options)
+    image = decode_source(thumbnailer, thumbnail_options, silent_template_exception)
+    return render_thumbnail(thumbnailer, thumbnail_options, image)
+
+
+def is_immutable_thumbnails_enabled():
+    return getattr(settings, 'DJANGOCMS_PICTURE_IMMUTABLE_THUMBNAILS', False)
+
+
+# the directory of the thumbnail storage content addressed thumbnails are
+# stored in
+# relative to the thumbnail storage, below the directory filer stores its
+# thumbnails in by default
+def get_immutable_thumbnails_dir():
+    base_dir = filer_settings.FILER_PUBLICMEDIA_THUMBNAIL_OPTIONS.get('base_dir', '')
+    return getattr(settings, 'DJANGOCMS_PICTURE_IMMUTABLE_THUMBNAILS_DIR', os.path.join(base_dir, 'immutable'))
+
+
+def get_immutable_thumbnail_name(thumbnailer, sha1, get_thumbnail_name, thumbnail_options, transparent=False):
+    """
+    Names the thumbnail after the checksum of the source file and a hash of
+    the normalized options, e.g.
+    ``filer_public_thumbnails/immutable/3f/3f2a…_9c41d0e2b7a8.webp``.
+    The content behind such a name never changes, a new version of the
+    source gets new names.
+    """
+    thumbnail_options = thumbnailer.get_options(thumbnail_options)
+    # the name easy_thumbnails would use decides the extension
+    extension = os.path.splitext(get_thumbnail_name(thumbnail_options, transparent))[1]
+    options_hash = hashlib.sha1(
+        ':'.join(thumbnail_options.prepared_options()).encode('utf-8'),
+    ).hexdigest()[:12]
+    return os.path.join(
+        get_immutable_thumbnails_dir(),
+        sha1[:2],
+        '{}_{}{}'.format(sha1, options_hash, extension),
+    )
+
+
+def get_picture_thumbnailer(source, extension=None):
+    # ``extension`` forces the output format, e.g. "webp" or "avif"
+    thumbnailer = get_thumbnailer(source)
+    if extension:
+        thumbnailer.thumbnail_extension = extension
+        thumbnailer.thumbnail_transparency_extension = extension
+        thumbnailer.thumbnail_preserve_extensions = False
+    if extension == 'avif':
+        thumbnailer.generate_thumbnail = partial(generate_avif_thumbnail, thumbnailer)
+    # filer's thumbnailers ignore ``thumbnail_namer``, the naming method is
+    # replaced instead
+    sha1 = getattr(source, 'sha1', None)
+    if sha1 and is_immutable_thumbnails_enabled():
+        thumbnailer.get_thumbnail_name = partial(
+            get_immutable_thumbnail_name, thumbnailer, sha1, thumbnailer.get_thumbnail_name,
+        )
+    return thumbnailer
+
+
+def get_fallback_url(thumbnailer, thumbnail_name):
+    fallback = get_async_fallback()
+    if fallback == 'thumbnail':
+        return thumbnailer.thumbnail_storage.url(thumbnail_name)
+    elif fallback == 'placeholder':
+        return PLACEHOLDER_URL
+    return thumbnailer.source_storage.url(thumbnailer.name)
+
+
+def track_generation(thumbnailer, info):
+    # records in ``info`` whether ``thumbnailer`` generates a thumbnail
+    generate = thumbnailer.generate_thumbnail
+
+    def generate_thumbnail(*args, **kwargs):
+        thumbnail = generate(*args, **kwargs)
+        info['cache_hit'] = False
+        info['bytes'] = thumbnail.file.size
+        return thumbnail
+
+    thumbnailer.generate_thumbnail = generate_thumbnail
+
+
+def generate_thumbnail(source, thumbnail_options, extension=None):
+    thumbnailer = get_picture_thumbnailer(source, extension)
+    with measure('get_thumbnail', extension=extension, cache_hit=True) as info:
+        if get_lock() is None:
+            if info is not None:
+                track_generation(thumbnailer, info)
+            return thumbnailer.get_thumbnail(thumbnail_options)
+
+        thumbnail_options = thumbnailer.get_options(thumbnail_options)
+        thumbnail = thumbnailer.get_existing_thumbnail(thumbnail_options)
+        if thumbnail:
+            return thumbnail
+        if info is not None:
+            info['cache_hit'] = False
+        thumbnail_name = thumbnailer.get_thumbnail_name(thumbnail_options)
+        thumbnail, = generate_locked_thumbnails(source, [(thumbnailer, thumbnail_options, thumbnail_name)])
+        if thumbnail is None:
+            if info is not None:
+                info['pending'] = True
+            return PendingThumbnail(get_fallback_url(thumbnailer, thumbnail_name))
+        return thumbnail
+
+
+def get_thumbnail_cache_key(source, thumbnail_options, extension=None):
+    # the key of a thumbnail in the cache of resolved thumbnails, None if
+    # the cache is disabled or ``source`` has no checksum
+    sha1 = getattr(source, 'sha1', None)
+    if not sha1 or get_thumbnail_cache() is None:
+        return None
+    return (
+        sha1,
+        source.file.name,
+        extension,
+        is_immutable_thumbnails_enabled(),
+        tuple(thumbnail_options.prepared_options()),
+    )
+
+
+def get_cached_thumbnail(cache_key):
+    value = get_thumbnail_cache().get(cache_key) if cache_key else None
+    return StoredThumbnail(*value) if value else None
+
+
+def cache_thumbnail(cache_key, source_size, thumbnail_options, thumbnail):
+    # remembers a thumbnail that exists, the dimensions are calculated from
+    # the (width, height) of the source so the file does not have to be read
+    if not cache_key or not thumbnail or isinstance(thumbnail, PendingThumbnail):
+        return
+    width = height = None
+    if source_size:
+        width, height = get_thumbnail_dimensions(source_size, **thumbnail_options)
+    get_thumbnail_cache().set(cache_key, (thumbnail.url, width, height))
+
+
+def get_thumbnail(source, thumbnail_options, extension=None, source_size=None):
+    """
+    Returns the thumbnail of ``source`` for ``thumbnail_options``. In async
+    mode a missing thumbnail is queued and a ``PendingThumbnail`` pointing
+    to the fallback is returned instead. ``source_size`` defaults to
+    ``get_source_size(source)``.
+    """
+    if source_size is None:
+        source_size = get_source_size(source)
+    thumbnailer = get_picture_thumbnailer(source, extension)
+    # filer names thumbnails from the options as given, normalize them to
+    # get the same name easy_thumbnails generates the thumbnail under
+    thumbnail_options = thumbnailer.get_options(thumbnail_options)
+    cache_key = get_thumbnail_cache_key(source, thumbnail_options, extension)
+    if cache_key:
+        thumbnail = get_cached_thumbnail(cache_key)
+        if thumbnail:
+            return thumbnail
+
+    if not is_async_enabled():
+        thumbnail = generate_thumbnail(source, thumbnail_options, extension)
+        cache_thumbnail(cache_key, source_size, thumbnail_options, thumbnail)
+        return thumbnail
+
+    with measure('get_thumbnail', extension=extension, cache_hit=True) as info:
+        thumbnail = thumbnailer.get_existing_thumbnail(thumbnail_options)
+        if thumbnail:
+            cache_thumbnail(cache_key, source_size, thumbnail_options, thumbnail)
+            return thumbnail
+
+        thumbnail_name = thumbnailer.get_thumbnail_name(thumbnail_options)
+        get_backend().submit(
+            thumbnail_name,
+            lambda: generate_thumbnail(source, thumbnail_options, extension),
+        )
+        if info is not None:
+            info.update(cache_hit=False, pending=True)
+        return PendingThumbnail(get_fallback_url(thumbnailer, thumbnail_name))
+
+
+def get_thumbnail_scale(source_size, size, crop=False, upscale=False, **kwargs):
+    # the factor easy_thumbnails' ``scale_and_crop`` processor resizes an
+    # image of ``source_size`` by
+    source_x, source_y = [float(value) for value in source_size]
+    target_x, target_y = [int(value or 0) for value in size]
+    if crop or not target_x or not target_y:
+        scale = max(target_x / source_x, target_y / source_y)
+    else:
+        scale = min(target_x / source_x, target_y / source_y)
+    if scale > 1.0 and not upscale:
+        return 1.0
+    return scale
+
+
+def get_thumbnail_dimensions(source_size, size, crop=False, upscale=False, **kwargs):
+    """
+    Returns the dimensions of a thumbnail of an image of ``source_size``,
+    calculated like easy_thumbnails' ``scale_and_crop`` processor does,
+    without opening any file.
+    """
+    source_x, source_y = [float(value) for value in source_size]
+    target_x, target_y = [int(value or 0) for value in size]
+    if not (source_x and source_y):
+        return target_x, target_y
+
+    if crop or not target_x or not target_y:
+        scale = max(target_x / source_x, target_y / source_y)
+    else:
+        scale = min(target_x / source_x, target_y / source_y)
+
+    if not target_x:
+        target_x = round(source_x * scale)
+    elif not target_y:
+        target_y = round(source_y * scale)
+
+    if scale < 1.0 or (scale > 1.0 and upscale):
+        width, height = int(round(source_x * scale)), int(round(source_y * scale))
+    else:
+        width, height = int(source_x), int(source_y)
+
+    if crop:
+        width, height = min(width, target_x), min(height, target_y)
+    return width, height
+
+
+def read_orientation(source):
+    # the EXIF orientation of the file of ``source``, None if it cannot be
+    # read. Pictures store it, rendering never opens the file
+    if source.extension == 'svg':
+        return 1
+    try:
+        with source.file.open('rb') as file, PILImage.open(file) as image:
+            return image.getexif().get(ExifTags.Base.Orientation, 1)
+    except (OSError, ValueError, SyntaxError):
+        logger.warning('Could not read the orientation of %s', source.file.name, exc_info=True)
+        return None
+
+
+def get_source_size(source, orientation=None):
+    """
+    Returns the (width, height) of ``source`` as its thumbnails show it, or
+    None if unknown. Filer stores the size of the file as is, easy_thumbnails
+    rotates the image by its EXIF ``orientation`` before resizing it. An
+    unknown orientation is taken as upright.
+    """
+    oriented_size = getattr(source, 'oriented_size', False)
+    if oriented_size is not False:
+        return oriented_size
+    if not (source.width and source.height):
+        return None
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        return (source.height, source.width)
+    return (source.width, source.height)
+
+
+def scale_subject_location(subject_location, scale):
+    try:
+        x, y = [float(value) for value in subject_location.split(',')]
+    except (AttributeError, ValueError):
+        return subject_location
+    return '{},{}'.format(int(round(x * scale)), int(round(y * scale)))
+
+
+def get_variant_workers():
+    return getattr(settings, 'DJANGOCMS_PICTURE_VARIANT_WORKERS', 4)
+
+
+def generate_thumbnails(source, pending):
+    """
+    Generates and saves the thumbnails of ``source`` for the (thumbnailer,
+    normalized thumbnail options) pairs in ``pending``. The source is decoded
+    once, JPEG files at a reduced resolution, and brought down to the
+    resolution the largest thumbnail needs. All thumbnails are then derived
+    from it, in a thread pool if there are several.
+    """
+    if not pending:
+        return []
+    if source.extension == 'svg':
+        thumbnails = []
+        for thumbnailer, thumbnail_options in pending:
+            thumbnail = thumbnailer.generate_thumbnail(thumbnail_options)
+            thumbnailer.save_thumbnail(thumbnail)
+            thumbnails.append(thumbnail)
+        return thumbnails
+
+    thumbnailer, thumbnail_options = pending[0]
+    image = decode_source(
+        thumbnailer, thumbnail_options,
+        variants=[thumbnail_options for thumbnailer, thumbnail_options in pending],
+    )
+    # the subject location is given in the coordinates of the source
+    source_width, source_height = image.info.get(SOURCE_SIZE_INFO, image.size)
+    scale = min(image.size[0] / source_width, image.size[1] / source_height)
+    resize = min(1.0, max(
+        get_thumbnail_scale(image.size, **thumbnail_options)
+        for thumbnailer, thumbnail_options in pending
+    ))
+    if resize < 1.0:
+        width, height = image.size
+        image = image.resize(
+            (max(1, int(round(width * resize))), max(1, int(round(height * resize)))),
+            PILImage.Resampling.LANCZOS,
+        )
+        scale *= resize
+
+    if len(pending) == 1:
+        thumbnails = [render_thumbnail(thumbnailer, thumbnail_options, image, scale)]
+    else:
+        # PIL releases the GIL while resizing and encoding, storage and
+        # database access stay in this thread
+        with ThreadPoolExecutor(
+            max_workers=min(get_variant_workers(), len(pending)),
+            thread_name_prefix='djangocms_picture_variants',
+        ) as executor:
+            thumbnails = list(executor.map(
+                lambda job: render_thumbnail(job[0], job[1], job[2], scale),
+                [(thumbnailer, thumbnail_options, image.copy()) for thumbnailer, thumbnail_options in pending],
+            ))
+    for (thumbnailer, thumbnail_options), thumbnail in zip(pending, thumbnails):
+        thumbnailer.save_thumbnail(thumbnail)
+    return thumbnails
+
+
+def generate_locked_thumbnails(source, pending):
+    """
+    ``generate_thumbnails`` for the (thumbnailer, normalized thumbnail
+    options, thumbnail name) triples in ``pending``, each thumbnail guarded
+    by the lock of ``get_lock``. Thumbnails generated by someone else while
+    waiting are reused, the ones still locked after the timeout are None.
+    """
+    lock = get_lock()
+    if lock is None:
+        return generate_thumbnails(source, [
+            (thumbnailer, thumbnail_options) for thumbnailer, thumbnail_options, thumbnail_name in pending
+        ])
+
+    thumbnails = [None] * len(pending)
+    deadline = time.monotonic() + get_lock_timeout()
+    # thumbnails sharing a lock are guarded by a single acquisition
+    groups = {}
+    for index, (thumbnailer, thumbnail_options, thumbnail_name) in enumerate(pending):
+        groups.setdefault(lock.get_lock_key(thumbnail_name), []).append(index)
+    handles = []
+    try:
+        missing = []
+        # a fixed order keeps two workers from waiting for each other
+        for lock_key in sorted(groups):
+            indexes = groups[lock_key]
+            handle = lock.acquire(pending[indexes[0]][2], max(0, deadline - time.monotonic()))
+            if handle is None:
+                continue
+            handles.append(handle)
+            for index in indexes:
+                thumbnailer, thumbnail_options, thumbnail_name = pending[index]
+                thumbnails[index] = thumbnailer.get_existing_thumbnail(thumbnail_options)
+                if not thumbnails[index]:
+                    missing.append(index)
+        generated = generate_thumbnails(source, [pending[index][:2] for index in missing])
+        for index, thumbnail in zip(missing, generated):
+            thumbnails[index] = thumbnail
+    finally:
+        for handle in handles:
+            lock.release(handle)
+    return thumbnails
+
+
+def get_thumbnails(source, variants, source_size=None):
+    """
+    Returns the thumbnails of ``source`` for the (thumbnail options,
+    extension) pairs in ``variants``. The missing ones are generated
+    together by ``generate_thumbnails``, in async mode by a single job.
+    """
+    if source_size is None:
+        source_size = get_source_size(source)
+    if len(variants) < 2:
+        return [
+            get_thumbnail(source, thumbnail_options, extension, source_size)
+            for thumbnail_options, extension in variants
+        ]
+
+    thumbnails = []
+    missing = OrderedDict()
+    for index, (thumbnail_options, extension) in enumerate(variants):
+        thumbnailer = get_picture_thumbnailer(source, extension)
+        thumbnail_options = thumbnailer.get_options(thumbnail_options)
+        cache_key = get_thumbnail_cache_key(source, thumbnail_options, extension)
+        thumbnail = get_cached_thumbnail(cache_key)
+        if not thumbnail:
+            with measure('get_thumbnail', extension=extension) as info:
+                thumbnail = thumbnailer.get_existing_thumbnail(thumbnail_options)
+                if info is not None:
+                    info['cache_hit'] = bool(thumbnail)
+            cache_thumbnail(cache_key, source_size, thumbnail_options, thumbnail)
+        thumbnails.append(thumbnail)
+        if not thumbnail:
+            thumbnail_name = thumbnailer.get_thumbnail_name(thumbnail_options)
+            job = missing.setdefault(thumbnail_name, (thumbnailer, thumbnail_options, extension, cache_key, []))
+            job[4].append(index)
+    if not missing:
+        return thumbnails
+
+    jobs = list(missing.items())
+    if is_async_enabled():
+        missing_variants = [
+            (thumbnail_options, extension)
+            for thumbnail_name, (thumbnailer, thumbnail_options, extension, cache_key, indexes) in jobs
+        ]
+        get_backend().submit(
+            ','.join(missing),
+            lambda: generate_missing_thumbnails(source, missing_variants),
+        )
+        generated = [None] * len(jobs)
+    else:
+        with measure('generate_thumbnails', count=len(jobs)) as info:
+            generated = generate_locked_thumbnails(source, [
+                (thumbnailer, thumbnail_options, thumbnail_name)
+                for thumbnail_name, (thumbnailer, thumbnail_options, extension, cache_key, indexes) in jobs
+            ])
+            if info is not None:
+                info['bytes'] = sum(thumbnail.file.size for thumbnail in generated if thumbnail)
+
+    for (thumbnail_name, job), thumbnail in zip(jobs, generated):
+        thumbnailer, thumbnail_options, extension, cache_key, indexes = job
+        if thumbnail:
+            cache_thumbnail(cache_key, source_size, thumbnail_options, thumbnail)
+        else:
+            # queued or still generated by someone else
+            thumbnail = PendingThumbnail(get_fallback_url(thumbnailer, thumbnail_name))
+        for index in indexes:
+            thumbnails[index] = thumbnail
+    return thumbnails
+
+
+def get_missing_thumbnails(source, variants):
+    # returns the (thumbnail options, extension) pairs of ``variants`` not
+    # generated yet
+    return [
+        (thumbnail_options, extension)
+        for thumbnailer, thumbnail_options, extension, thumbnail_name in find_missing_thumbnails(source, variants)
+    ]
+
+
+def find_missing_thumbnails(source, variants):
+    # returns the (thumbnailer, normalized thumbnail options, extension,
+    # thumbnail name) of the thumbnails of ``variants`` not generated yet
+    missing = {}
+    for thumbnail_options, extension in variants:
+        thumbnailer = get_picture_thumbnailer(source, extension)
+        thumbnail_options = thumbnailer.get_options(thumbnail_options)
+        if not thumbnailer.get_existing_thumbnail(thumbnail_options):
+            thumbnail_name = thumbnailer.get_thumbnail_name(thumbnail_options)
+            missing.setdefault(thumbnail_name, (thumbnailer, thumbnail_options, extension, thumbnail_name))
+    return list(missing.values())
+
+
+def generate_missing_thumbnails(source, variants):
+    missing = find_missing_thumbnails(source, variants)
+    generate_locked_thumbnails(source, [
+        (thumbnailer, thumbnail_options, thumbnail_name)
+        for thumbnailer, thumbnail_options, extension, thumbnail_name in missing
+    ])
+    return len(missing)
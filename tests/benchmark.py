@@ -0,0 +1,286 @@
+"""
+Benchmarks rendering pictures and resolving their thumbnails, offline with
+an in-memory SQLite database and a temporary media directory.
+
+Run it from the repository root, the results are written as JSON::
+
+    python -m tests.benchmark --output benchmark.json
+
+Compare the results of two releases with ``--compare previous.json``, which
+reports every timing that got slower by more than ``--threshold`` and every
+additional query, and exits with status 1 if there are any.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+    import django
+
+    django.setup()
+
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+
+    from django.db import connection
+
+    # SQLite test databases live in memory
+    connection.creation.create_test_db(verbosity=0)
+
+
+def timed(func, repeat=1):
+    # returns the timings of ``repeat`` calls in milliseconds and the
+    # result of the last call
+    timings = []
+    for index in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, result
+
+
+def summarize(timings):
+    return {
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "runs": len(timings),
+    }
+
+
+def count_queries(func):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    return len(queries)
+
+
+def get_request():
+    from django.contrib.auth.models import AnonymousUser
+    from django.test import RequestFactory
+
+    request = RequestFactory().get("/")
+    request.session = {}
+    request.user = AnonymousUser()
+    request.current_page = None
+    request.LANGUAGE_CODE = "en"
+    return request
+
+
+def create_pictures(placeholder, count):
+    from cms.api import add_plugin
+
+    from .helpers import get_filer_image
+
+    for index in range(count):
+        add_plugin(
+            placeholder=placeholder,
+            plugin_type="PicturePlugin",
+            language="en",
+            picture=get_filer_image("image-{}.jpg".format(index)),
+            width=720,
+            height=480,
+        )
+
+
+def render_placeholder(placeholder_pk):
+    # a new renderer and placeholder per run, like a new request
+    from django.template import Context
+
+    from cms.models import Placeholder
+    from cms.plugin_rendering import ContentRenderer
+
+    request = get_request()
+    placeholder = Placeholder.objects.get(pk=placeholder_pk)
+    renderer = ContentRenderer(request)
+    context = Context({"request": request})
+    return renderer.render_placeholder(placeholder, context, language="en")
+
+
+def benchmark_placeholders(sizes, repeat):
+    from cms.models import Placeholder
+
+    results = {}
+    for size in sizes:
+        placeholder = Placeholder.objects.create(slot="benchmark-{}".format(size))
+        create_pictures(placeholder, size)
+
+        def render():
+            return render_placeholder(placeholder.pk)
+
+        cold, content = timed(render)
+        warm, content = timed(render, repeat)
+        queries = count_queries(render)
+        results[str(size)] = {
+            "cold": summarize(cold),
+            "warm": summarize(warm),
+            "queries": queries,
+            "queries_per_plugin": round(queries / size, 2),
+            "bytes": len(content),
+        }
+    return results
+
+
+def benchmark_thumbnails(repeat):
+    from djangocms_picture.models import Picture
+
+    from .helpers import get_filer_image
+
+    results = {}
+    for name in ("img_src", "img_srcset_data"):
+        picture = Picture.objects.create(
+            template="default",
+            picture=get_filer_image("{}.jpg".format(name), size=(1600, 1200)),
+            width=1200,
+            height=900,
+        )
+
+        def resolve():
+            # a fresh instance resolves the thumbnails again
+            return getattr(Picture.objects.get(pk=picture.pk), name)
+
+        cold, value = timed(resolve)
+        warm, value = timed(resolve, repeat)
+        instance = Picture.objects.get(pk=picture.pk)
+        getattr(instance, name)
+        memoized, value = timed(lambda: getattr(instance, name), repeat)
+        results[name] = {
+            "cold": summarize(cold),
+            "warm": summarize(warm),
+            "memoized": summarize(memoized),
+            "warm_queries": count_queries(resolve),
+        }
+    return results
+
+
+def benchmark_template(repeat):
+    from django.template.loader import get_template
+
+    from djangocms_picture.models import Picture
+
+    from .helpers import get_filer_image
+
+    instance = Picture.objects.create(
+        template="default",
+        picture=get_filer_image("template.jpg"),
+        width=720,
+        height=480,
+        caption_text="caption",
+    )
+    context = {
+        "instance": instance,
+        "picture_size": instance.get_cached_size(),
+        "img_srcset_data": instance.img_srcset_data,
+        "img_density_srcset_data": instance.img_density_srcset_data,
+        "picture_sources": instance.img_sources,
+        "picture_dimensions": instance.img_dimensions,
+    }
+    template = get_template("djangocms_picture/default/picture.html")
+    # the first render loads the template tags
+    template.render(context)
+    timings, content = timed(lambda: template.render(context), repeat)
+    return {"default/picture.html": summarize(timings)}
+
+
+def get_environment():
+    import django
+
+    import cms
+
+    import easy_thumbnails
+    import filer
+    import PIL
+
+    import djangocms_picture
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "django": django.get_version(),
+        "django-cms": cms.__version__,
+        "django-filer": filer.__version__,
+        "easy-thumbnails": easy_thumbnails.get_version(),
+        "pillow": PIL.__version__,
+        "djangocms-picture": djangocms_picture.__version__,
+    }
+
+
+def flatten(results, prefix=""):
+    # maps "placeholders.10.warm.median_ms" style keys to numbers
+    flat = {}
+    for key, value in results.items():
+        name = "{}{}".format(prefix, key)
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(results, previous, threshold):
+    # returns the median timings slower than ``threshold`` times the
+    # previous results and every additional query
+    current = flatten(results["benchmarks"])
+    regressions = {}
+    for name, value in flatten(previous["benchmarks"]).items():
+        if name not in current:
+            continue
+        if name.endswith("median_ms"):
+            regressed = value and current[name] > value * threshold
+        else:
+            regressed = name.endswith("queries") and current[name] > value
+        if regressed:
+            regressions[name] = {"previous": value, "current": current[name]}
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="writes the JSON results to a file instead of stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    options = parser.parse_args(argv)
+    output_path = options.output and os.path.abspath(options.output)
+    compare_path = options.compare and os.path.abspath(options.compare)
+
+    # media files are written relative to the working directory
+    media_root = tempfile.mkdtemp(prefix="djangocms_picture_benchmark")
+    os.chdir(media_root)
+    setup_django()
+
+    results = {
+        "environment": get_environment(),
+        "options": {"sizes": options.sizes, "repeat": options.repeat},
+        "benchmarks": {
+            "placeholders": benchmark_placeholders(options.sizes, options.repeat),
+            "thumbnails": benchmark_thumbnails(options.repeat),
+            "templates": benchmark_template(options.repeat),
+        },
+    }
+    if compare_path:
+        with open(compare_path) as file:
+            results["regressions"] = compare(results, json.load(file), options.threshold)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if output_path:
+        with open(output_path, "w") as file:
+            file.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+    return 1 if results.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
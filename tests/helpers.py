@@ -7,6 +7,7 @@ from filer.models.filemodels import File as FilerFile
 from filer.models.foldermodels import Folder as FilerFolder
 from filer.models.imagemodels import Image as FilerImage
 from filer.utils.compatibility import PILImage, PILImageDraw
+from PIL import ExifTags
 
 
 # from https://github.com/divio/django-filer/blob/develop/tests/helpers.py#L46-L52
@@ -24,19 +25,25 @@ def create_image(mode="RGB", size=(800, 600)):
     return image
 
 
-def get_image(image_name="test_file.jpg", size=(800, 600)):
+def get_image(image_name="test_file.jpg", size=(800, 600), mode="RGB", orientation=None):
     """
     Creates and stores an image to the file system using PILImage
 
-    :param image_name: the name for the file (default "test_file.jpg")
+    :param image_name: the name for the file (default "test_file.jpg"), its
+        extension selects the format
+    :param mode: the PIL image mode, e.g. "RGBA" for a transparent PNG
+    :param orientation: optionally the EXIF orientation of the stored image
     :returns: dict {name, image, path}
     """
-    image = create_image(size=size)
+    image = create_image(mode=mode, size=size)
     image_path = os.path.join(
         mkdtemp(),
         image_name,
     )
-    image.save(image_path, "JPEG")
+    exif = PILImage.Exif()
+    if orientation:
+        exif[ExifTags.Base.Orientation] = orientation
+    image.save(image_path, exif=exif)
 
     return {
         "name": image_name,
@@ -65,14 +72,16 @@ def get_file(file_name="test_file.pdf"):
     }
 
 
-def get_filer_image(image_name="test_file.jpg", size=(800, 600)):
+def get_filer_image(image_name="test_file.jpg", size=(800, 600), mode="RGB", orientation=None):
     """
     Creates and stores an image to filer and returns it
 
     :param image_name: the name for the file (default "test_file.jpg")
+    :param mode: the PIL image mode
+    :param orientation: optionally the EXIF orientation of the stored image
     :returns: filer image instance
     """
-    image = get_image(image_name, size)
+    image = get_image(image_name, size, mode, orientation)
     filer_file = File(
         open(image.get("path"), "rb"),
         name=image.get("name"),
@@ -15,6 +15,7 @@ INSTALLED_APPS = [
     "cms",
     "menus",
     "treebeard",
+    "sekizai",
     "easy_thumbnails",
     "filer",
     "djangocms_picture",
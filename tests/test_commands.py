@@ -0,0 +1,173 @@
+from io import StringIO
+from tempfile import mkdtemp
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from easy_thumbnails.files import get_thumbnailer
+from filer import settings as filer_settings
+
+from djangocms_picture.models import ExternalImage, Picture
+from djangocms_picture.thumbnails import (
+    get_immutable_thumbnails_dir, read_orientation,
+)
+
+from .helpers import get_filer_image
+
+
+class WarmThumbnailsTestCase(TestCase):
+
+    def setUp(self):
+        image = get_filer_image()
+        self.pictures = [
+            Picture.objects.create(template="default", picture=image),
+            # shares all thumbnails with the first plugin
+            Picture.objects.create(template="default", picture=image),
+            Picture.objects.create(template="default", picture=image, use_crop=True),
+            Picture.objects.create(template="default", external_picture="https://www.example.com/logo.png"),
+        ]
+
+    def call_command(self, *args):
+        output = StringIO()
+        call_command("picture_warm_thumbnails", "--processes=1", *args, stdout=output)
+        return output.getvalue()
+
+    def test_warm_thumbnails(self):
+        # an 800px wide source gets the 576 and 768 breakpoints
+        output = self.call_command("--dry-run")
+        self.assertIn("3/3 pictures processed", output)
+        self.assertIn("6 thumbnails would be generated.", output)
+        output = self.call_command()
+        self.assertIn("6 thumbnails generated.", output)
+        output = self.call_command("--dry-run")
+        self.assertIn("0 thumbnails would be generated.", output)
+
+    def test_orientations(self):
+        # pictures saved before the orientation was stored read it once
+        Picture.objects.update(picture_orientation=None)
+        rotated = Picture.objects.create(template="default", picture=get_filer_image(orientation=6))
+        Picture.objects.filter(pk=rotated.pk).update(picture_orientation=None)
+        output = self.call_command("--dry-run")
+        self.assertIn("4 orientations would be stored.", output)
+        self.assertFalse(Picture.objects.exclude(picture_orientation=None).exists())
+        with mock.patch("djangocms_picture.management.commands.picture_warm_thumbnails.read_orientation",
+                        wraps=read_orientation) as read:
+            output = self.call_command()
+        self.assertIn("4 orientations stored.", output)
+        self.assertEqual(read.call_count, 2)
+        self.assertEqual(Picture.objects.get(pk=rotated.pk).picture_orientation, 6)
+        self.assertEqual(Picture.objects.get(pk=rotated.pk).source_size, (600, 800))
+        self.assertIn("0 orientations stored.", self.call_command())
+
+    def test_processes(self):
+        output = StringIO()
+        call_command("picture_warm_thumbnails", "--processes=2", stdout=output)
+        self.assertIn("6 thumbnails generated.", output.getvalue())
+        # the parent can still use its connection
+        self.assertEqual(Picture.objects.count(), 4)
+        output = self.call_command("--dry-run")
+        self.assertIn("0 thumbnails would be generated.", output)
+
+    def test_chunks(self):
+        output = self.call_command("--dry-run", "--chunk-size=2")
+        self.assertIn("2/3 pictures processed", output)
+        self.assertIn("3/3 pictures processed", output)
+        output = self.call_command("--dry-run", "--start-pk={}".format(self.pictures[2].pk))
+        self.assertIn("1/1 pictures processed", output)
+        self.assertIn("3 thumbnails would be generated.", output)
+
+
+class RebuildManifestsTestCase(TestCase):
+
+    def test_rebuild_manifests(self):
+        picture = Picture.objects.create(template="default", picture=get_filer_image())
+        output = StringIO()
+        with override_settings(DJANGOCMS_PICTURE_VARIANT_MANIFEST=True):
+            call_command("picture_rebuild_manifests", stdout=output)
+            self.assertIn("1 manifests updated.", output.getvalue())
+            picture.refresh_from_db()
+            self.assertEqual(picture.get_variant_manifest(), picture.variant_manifest)
+            call_command("picture_rebuild_manifests", stdout=output)
+            self.assertIn("0 manifests updated.", output.getvalue())
+
+
+class ThumbnailGCTestCase(TestCase):
+
+    def setUp(self):
+        # every test starts with an empty storage
+        media_root = self.settings(MEDIA_ROOT=mkdtemp())
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.storage = filer_settings.FILER_PUBLICMEDIA_THUMBNAIL_STORAGE
+        self.image = get_filer_image()
+        self.picture = Picture.objects.create(template="default", picture=self.image, width=720, height=480)
+        self.picture.img_src
+        self.picture.img_srcset_data
+        # filer's admin thumbnails are kept
+        self.image.icons
+        self.stale = get_thumbnailer(self.image).get_thumbnail({"size": (300, 300)}).name
+        # a thumbnail of an image of no picture plugin is not ours
+        self.unused = get_thumbnailer(get_filer_image("unused.jpg")).get_thumbnail({"size": (300, 300)}).name
+        self.orphan = self.storage.save(
+            "filer_public_thumbnails/filer_public/gone/image.jpg__100x100_q85.jpg",
+            ContentFile(b"thumbnail"),
+        )
+
+    def call_command(self, *args):
+        output = StringIO()
+        call_command("picture_thumbnail_gc", "--list", *args, stdout=output)
+        return output.getvalue()
+
+    def test_dry_run(self):
+        output = self.call_command("--dry-run", "--stale")
+        self.assertIn(self.stale, output)
+        self.assertIn(self.orphan, output)
+        self.assertNotIn(self.unused, output)
+        self.assertIn("2 thumbnails would be deleted, freeing", output)
+        self.assertTrue(self.storage.exists(self.stale))
+
+    @override_settings(DJANGOCMS_PICTURE_EXTERNAL_IMAGES=True)
+    def test_external_pictures(self):
+        # external pictures are neither fetched nor revalidated
+        Picture.objects.create(template="default", external_picture="https://www.example.com/image.jpg")
+        with mock.patch("djangocms_picture.external.get_fetcher") as get_fetcher:
+            self.assertIn("2 thumbnails would be deleted", self.call_command("--dry-run", "--stale"))
+        get_fetcher.assert_not_called()
+        self.assertFalse(ExternalImage.objects.exists())
+
+    def test_delete(self):
+        output = self.call_command("--batch-size=1", "--stale")
+        self.assertIn("2 thumbnails deleted", output)
+        self.assertFalse(self.storage.exists(self.stale))
+        self.assertFalse(self.storage.exists(self.orphan))
+        self.assertTrue(self.storage.exists(self.unused))
+        self.assertTrue(self.storage.exists(self.picture.img_src.split("/media/", 1)[1]))
+        self.assertIn("0 thumbnails deleted", self.call_command("--stale"))
+        # the deleted thumbnail is generated again when it is requested
+        thumbnail = get_thumbnailer(self.image).get_thumbnail({"size": (300, 300)})
+        self.assertTrue(self.storage.exists(thumbnail.name))
+
+    def test_orphans(self):
+        # by default only the thumbnails of deleted images are deleted
+        output = self.call_command()
+        self.assertIn("1 thumbnails deleted", output)
+        self.assertFalse(self.storage.exists(self.orphan))
+        self.assertTrue(self.storage.exists(self.stale))
+
+    @override_settings(DJANGOCMS_PICTURE_IMMUTABLE_THUMBNAILS=True)
+    def test_immutable_thumbnails(self):
+        img_src = Picture.objects.get(pk=self.picture.pk).img_src
+        orphan = self.storage.save(
+            "{}/ab/{}_{}.jpg".format(get_immutable_thumbnails_dir(), "ab" * 20, "0" * 12),
+            ContentFile(b"thumbnail"),
+        )
+        self.assertTrue(orphan.startswith("filer_public_thumbnails/immutable/"))
+        output = self.call_command()
+        self.assertIn(orphan, output)
+        self.assertIn("2 thumbnails deleted", output)
+        output = self.call_command("--stale")
+        self.assertNotIn(img_src.split("/media/", 1)[1], output)
+        # the variants named the other way are outdated
+        self.assertIn("3 thumbnails deleted", output)
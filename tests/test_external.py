@@ -0,0 +1,226 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO
+from tempfile import mkdtemp
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from PIL import ExifTags
+from PIL import Image as PILImage
+
+from djangocms_picture.external import (
+    check_url, fetch, probe, probe_external_image,
+)
+from djangocms_picture.models import (
+    ExternalImage, Picture, get_external_dimensions, get_external_image,
+)
+from djangocms_picture.thumbnails import get_backend
+
+from .helpers import create_image
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    # serves the image of the server under any path
+    def do_GET(self):
+        self.server.requests.append(self.headers.get("If-None-Match"))
+        self.server.ranges.append(self.headers.get("Range"))
+        if self.path == "/missing.jpg":
+            self.send_error(404)
+        elif self.path == "/bad-status.jpg":
+            self.wfile.write(b"garbage\r\n\r\n")
+        elif self.path == "/redirect.jpg":
+            # localhost is not an allowed host
+            self.send_response(302)
+            self.send_header("Location", "http://localhost:{}/image.jpg".format(self.server.server_port))
+            self.end_headers()
+        elif self.headers.get("If-None-Match") == self.server.etag:
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("ETag", self.server.etag)
+            self.end_headers()
+            if self.path == "/rotated.jpg":
+                self.wfile.write(self.server.rotated_content)
+            else:
+                self.wfile.write(self.server.content)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(
+    DJANGOCMS_PICTURE_EXTERNAL_IMAGES=True,
+    DJANGOCMS_PICTURE_EXTERNAL_IMAGES_ALLOWED_HOSTS=["127.0.0.1"],
+    MEDIA_ROOT=mkdtemp(),
+)
+class ExternalImageTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = HTTPServer(("127.0.0.1", 0), ImageHandler)
+        cls.server.requests = []
+        cls.server.ranges = []
+        cls.server.etag = '"first"'
+        data = BytesIO()
+        create_image(size=(800, 600)).save(data, "JPEG")
+        cls.server.content = data.getvalue()
+        data = BytesIO()
+        exif = PILImage.Exif()
+        exif[ExifTags.Base.Orientation] = 6
+        create_image(size=(800, 600)).save(data, "JPEG", exif=exif)
+        cls.server.rotated_content = data.getvalue()
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.url = "http://127.0.0.1:{}/image.jpg".format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requests.clear()
+        self.server.ranges.clear()
+        self.picture = Picture.objects.create(
+            template="default",
+            external_picture=self.url,
+            width=720,
+            height=480,
+        )
+
+    def test_get_external_image(self):
+        external_image = get_external_image(self.url)
+        self.assertEqual((external_image.width, external_image.height), (800, 600))
+        self.assertEqual(external_image.etag, '"first"')
+        self.assertTrue(external_image.file.name.endswith(".jpg"))
+        self.assertEqual(self.server.requests, [None])
+
+        # the local copy is reused until it is outdated
+        get_external_image(self.url)
+        self.assertEqual(len(self.server.requests), 1)
+        with self.settings(DJANGOCMS_PICTURE_EXTERNAL_IMAGES_TTL=-1):
+            self.assertEqual(get_external_image(self.url).file.name, external_image.file.name)
+        self.assertEqual(self.server.requests, [None, '"first"'])
+
+    def test_check_url(self):
+        for url in [
+            "file:///etc/passwd",
+            "http://localhost/image.jpg",
+            "http://10.0.0.1/image.jpg",
+            "http://169.254.169.254/latest/meta-data/",
+            "http://[::1]/image.jpg",
+            "http://[::ffff:127.0.0.1]/image.jpg",
+        ]:
+            with self.assertRaises(ValueError, msg=url):
+                check_url(url)
+        check_url("http://93.184.216.34/image.jpg")
+        check_url(self.url)
+
+        # redirects are checked as well
+        url = "http://127.0.0.1:{}/redirect.jpg".format(self.server.server_port)
+        with self.assertRaises(ValueError):
+            fetch(url)
+        self.assertIsNone(get_external_image(url))
+        self.assertEqual(self.server.requests, [None, None])
+
+    def test_rotated(self):
+        # the dimensions are stored rotated by the EXIF orientation
+        url = "http://127.0.0.1:{}/rotated.jpg".format(self.server.server_port)
+        external_image = get_external_image(url)
+        self.assertEqual((external_image.width, external_image.height), (600, 800))
+        self.assertEqual(probe(url), (600, 800, "JPEG"))
+        picture = Picture.objects.create(template="default", external_picture=url, width=300, height=800)
+        self.assertEqual(picture.img_dimensions, (300, 400))
+        self.assertEqual(picture.img_dimensions, picture.get_img_src_thumbnail().image.size)
+
+    def test_dns_rebinding(self):
+        # the connection is made to the address that was checked, a host
+        # resolving to an internal address on the second lookup is refused
+        port = self.server.server_port
+        addresses = [
+            [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", ("93.184.216.34", port))],
+            [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", ("127.0.0.1", port))],
+        ]
+        with mock.patch("socket.getaddrinfo", side_effect=addresses):
+            with self.assertRaisesMessage(ValueError, "is not a public address: 127.0.0.1"):
+                fetch("http://rebinding.example.com:{}/image.jpg".format(port))
+        self.assertEqual(self.server.requests, [])
+
+    def test_failed_fetch(self):
+        for name in ["missing.jpg", "bad-status.jpg"]:
+            url = "http://127.0.0.1:{}/{}".format(self.server.server_port, name)
+            self.assertIsNone(get_external_image(url))
+            self.assertIsNotNone(ExternalImage.objects.get(external_url=url).fetched_at)
+            picture = Picture.objects.create(template="default", external_picture=url)
+            self.assertEqual(picture.img_src, url)
+
+        # images too large to decode safely are not stored
+        url = "http://127.0.0.1:{}/large.jpg".format(self.server.server_port)
+        with mock.patch.object(PILImage, "MAX_IMAGE_PIXELS", 100):
+            self.assertIsNone(get_external_image(url))
+        self.assertIsNotNone(ExternalImage.objects.get(external_url=url).fetched_at)
+
+    def test_thumbnails(self):
+        instance = self.picture
+        self.assertIn("external_pictures/", instance.img_src)
+        self.assertNotEqual(instance.img_src, self.url)
+        self.assertEqual(instance.img_dimensions, (640, 480))
+        self.assertEqual(instance.img_srcset_data[0][0], 576)
+
+        with self.settings(DJANGOCMS_PICTURE_EXTERNAL_IMAGES=False):
+            instance.refresh_from_db()
+            self.assertEqual(instance.img_src, self.url)
+            self.assertIsNone(instance.img_srcset_data)
+
+    def test_fetcher(self):
+        fetcher = mock.Mock(side_effect=OSError)
+        with mock.patch("djangocms_picture.external.get_fetcher", return_value=fetcher):
+            self.assertIsNone(get_external_image(self.url))
+        fetcher.assert_called_once_with(self.url, etag="", last_modified="")
+
+
+@override_settings(
+    DJANGOCMS_PICTURE_EXTERNAL_IMAGES_PROBE=True,
+    DJANGOCMS_PICTURE_THUMBNAIL_BACKEND="djangocms_picture.thumbnails.LocalBackend",
+)
+class ExternalImageProbeTestCase(ExternalImageTestCase):
+    # runs the tests of the local copies again with probing enabled
+
+    def setUp(self):
+        super().setUp()
+        self.backend = get_backend()
+        self.backend.queue.clear()
+
+    def test_probe(self):
+        self.assertEqual(probe(self.url), (800, 600, "JPEG"))
+        self.assertEqual(self.server.ranges, ["bytes=0-65535"])
+
+    def test_failed_probe(self):
+        url = "http://127.0.0.1:{}/bad-status.jpg".format(self.server.server_port)
+        external_image = ExternalImage.objects.create(external_url=url)
+        self.assertFalse(probe_external_image(external_image))
+        self.assertIsNotNone(ExternalImage.objects.get(external_url=url).probed_at)
+
+    @override_settings(DJANGOCMS_PICTURE_EXTERNAL_IMAGES=False)
+    def test_get_external_dimensions(self):
+        # probing never blocks the render
+        self.assertIsNone(get_external_dimensions(self.url))
+        self.assertEqual(self.server.ranges, [])
+        self.backend.run()
+        self.assertEqual(get_external_dimensions(self.url), (800, 600))
+        self.assertEqual(len(self.backend.queue), 0)
+        self.assertEqual(ExternalImage.objects.get(external_url=self.url).format, "JPEG")
+
+        instance = self.picture
+        self.assertEqual(instance.img_src, self.url)
+        self.assertEqual(instance.source_size, (800, 600))
+        self.assertEqual(instance.get_size()["size"], (800, 600))
+        self.assertEqual(instance.img_dimensions, (720, 480))
+        instance.height = None
+        self.assertEqual(instance.img_dimensions, (720, 540))
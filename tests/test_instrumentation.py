@@ -0,0 +1,152 @@
+import importlib
+import sys
+import threading
+import types
+from unittest import mock
+
+from django.test import TestCase
+
+from djangocms_picture.instrumentation import (
+    StatsdReceiver, measure, picture_measured,
+)
+from djangocms_picture.models import Picture
+
+from .helpers import get_filer_image
+
+
+class InstrumentationTestCase(TestCase):
+
+    def setUp(self):
+        self.measurements = []
+        picture_measured.connect(self.record)
+        self.picture = Picture.objects.create(
+            template="default",
+            picture=get_filer_image(),
+            width=720,
+            height=480,
+        )
+        self.picture.refresh_from_db()
+
+    def tearDown(self):
+        picture_measured.disconnect(self.record)
+
+    def record(self, sender, **kwargs):
+        self.measurements.append(kwargs)
+
+    def get_measurements(self, operation):
+        return [measurement for measurement in self.measurements if measurement["operation"] == operation]
+
+    def test_thumbnails(self):
+        self.picture.img_src
+        self.assertEqual(len(self.get_measurements("img_src")), 1)
+        self.assertEqual(len(self.get_measurements("get_size")), 1)
+        # the source and the 576 breakpoint are generated together
+        lookups = self.get_measurements("get_thumbnail")
+        self.assertEqual(len(lookups), 2)
+        self.assertFalse(any(lookup["cache_hit"] for lookup in lookups))
+        generation, = self.get_measurements("generate_thumbnails")
+        self.assertEqual(generation["count"], 2)
+        self.assertGreater(generation["bytes"], 0)
+        self.assertGreater(generation["queries"], 0)
+        self.assertGreater(generation["duration"], 0)
+
+        # memoized values are not measured again
+        self.picture.img_src
+        self.assertEqual(len(self.get_measurements("img_src")), 1)
+
+        self.picture.refresh_from_db()
+        self.picture.img_src
+        thumbnail = self.get_measurements("get_thumbnail")[-1]
+        self.assertTrue(thumbnail["cache_hit"])
+        self.assertNotIn("bytes", thumbnail)
+
+    def test_img_srcset_data(self):
+        self.picture.img_srcset_data
+        measurement, = self.get_measurements("img_srcset_data")
+        self.assertIs(measurement["instance"], self.picture)
+        self.assertEqual(len(self.get_measurements("get_thumbnail")), 2)
+
+    def test_statsd_receiver(self):
+        client = mock.Mock()
+        receiver = StatsdReceiver(client)
+        receiver(None, "get_thumbnail", 0.5, 2, cache_hit=False, bytes=100)
+        client.timing.assert_any_call("djangocms_picture.get_thumbnail", 500)
+        client.timing.assert_any_call("djangocms_picture.get_thumbnail.queries", 2)
+        client.incr.assert_any_call("djangocms_picture.get_thumbnail.miss")
+        client.incr.assert_any_call("djangocms_picture.get_thumbnail.bytes", 100)
+
+    def test_no_receivers(self):
+        picture_measured.disconnect(self.record)
+        with measure("render") as info:
+            self.assertIsNone(info)
+
+
+class Panel:
+    # the parts of debug_toolbar.panels.Panel the picture panel uses
+    def __init__(self, toolbar, get_response):
+        self.toolbar = toolbar
+        self.get_response = get_response
+        self.stats = {}
+
+    def record_stats(self, stats):
+        self.stats.update(stats)
+
+    def get_stats(self):
+        return self.stats
+
+
+class PicturePanelTestCase(TestCase):
+
+    def setUp(self):
+        panels = types.ModuleType("debug_toolbar.panels")
+        panels.Panel = Panel
+        patcher = mock.patch.dict(sys.modules, {
+            "debug_toolbar": types.ModuleType("debug_toolbar"),
+            "debug_toolbar.panels": panels,
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sys.modules.pop("djangocms_picture.panels", None)
+        self.panels = importlib.import_module("djangocms_picture.panels")
+        self.picture = Picture.objects.create(
+            template="default",
+            picture=get_filer_image(),
+            width=720,
+            height=480,
+        )
+        self.picture.refresh_from_db()
+
+    def test_panel(self):
+        panel = self.panels.PicturePanel(None, None)
+        other = self.panels.PicturePanel(None, None)
+
+        def concurrent_request():
+            other.enable_instrumentation()
+            with measure("render"):
+                pass
+            other.disable_instrumentation()
+
+        panel.enable_instrumentation()
+        try:
+            self.picture.img_src
+            # a request handled at the same time is recorded by its own panel
+            thread = threading.Thread(target=concurrent_request)
+            thread.start()
+            thread.join()
+        finally:
+            panel.disable_instrumentation()
+        self.picture.img_srcset_data
+
+        self.assertEqual([measurement["operation"] for measurement in other.measurements], ["render"])
+        operations = [measurement["operation"] for measurement in panel.measurements]
+        self.assertNotIn("render", operations)
+        self.assertNotIn("img_srcset_data", operations)
+        self.assertEqual(panel.nav_subtitle, "2 thumbnails, 2 generated")
+
+        panel.generate_stats(None, None)
+        stats = panel.get_stats()
+        self.assertEqual(stats["measurements"], panel.measurements)
+        totals = dict(stats["totals"])
+        self.assertEqual(totals["get_thumbnail"]["count"], 2)
+        self.assertEqual(totals["img_src"]["count"], 1)
+        self.assertGreater(totals["generate_thumbnails"]["queries"], 0)
@@ -1,16 +1,20 @@
+from unittest import mock
+
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from cms.api import create_page
 
 from easy_thumbnails.files import ThumbnailFile
 from filer.models import ThumbnailOption
 
+from djangocms_picture import thumbnails
 from djangocms_picture.models import (
     LINK_TARGET, PICTURE_RATIO, RESPONSIVE_IMAGE_CHOICES, Picture,
-    get_alignment, get_templates,
+    get_alignment, get_templates, prefetch_pictures,
 )
+from djangocms_picture.previews import generate_preview
 
 from .helpers import get_filer_image
 
@@ -214,6 +218,65 @@ class PictureModelTestCase(TestCase):
         instance.external_picture = self.external_picture
         self.assertIsNone(instance.img_srcset_data)
 
+    def test_variant_specs(self):
+        instance = self.picture
+        instance.picture.subject_location = "600,300"
+        img_src_options = instance.get_img_src_options()
+        self.assertEqual(img_src_options, {
+            "size": (720, 480),
+            "crop": False,
+            "upscale": False,
+            "subject_location": "600,300",
+        })
+        # the srcset scales the rendered 640x480 thumbnail down
+        (size, thumbnail_options), = instance.get_img_srcset_options()
+        self.assertEqual(size, 576)
+        self.assertEqual(thumbnail_options, dict(img_src_options, size=(576, 432)))
+        thumbnail = instance.img_srcset_data[0][1]
+        self.assertEqual((thumbnail.width, thumbnail.height), (576, 432))
+
+        # cropped variants keep the aspect ratio and the subject location
+        instance.use_crop = True
+        (size, thumbnail_options), = instance.get_img_srcset_options()
+        self.assertEqual(thumbnail_options, dict(img_src_options, size=(576, 384), crop=True))
+        thumbnail = instance.img_srcset_data[0][1]
+        self.assertEqual((thumbnail.width, thumbnail.height), (576, 384))
+
+        # a breakpoint at the width of img_src reuses its thumbnail
+        with self.settings(DJANGOCMS_PICTURE_RESPONSIVE_IMAGES_VIEWPORT_BREAKPOINTS=[576, 576, 720]):
+            self.assertEqual([size for size, options in instance.get_img_srcset_options()], [576])
+
+    def test_srcset_larger_than_source(self):
+        # an 800x600 image is rendered at its size in a larger box, the
+        # srcset scales it down
+        instance = self.picture
+        instance.thumbnail_options = ThumbnailOption.objects.create(
+            name="large",
+            width=1600,
+            height=1200,
+            crop=False,
+            upscale=False,
+        )
+        self.assertEqual(instance.img_dimensions, (800, 600))
+        self.assertEqual(
+            [(size, options["size"]) for size, options in instance.get_img_srcset_options()],
+            [(576, (576, 432)), (768, (768, 576))],
+        )
+        names = {instance.img_src}
+        for size, thumbnail in instance.img_srcset_data:
+            self.assertEqual(thumbnail.width, size)
+            names.add(thumbnail.url)
+        self.assertEqual(len(names), 3)
+
+        # the same with the width and height fields
+        instance = Picture.objects.get(pk=self.picture.pk)
+        instance.width = 1600
+        instance.height = 1200
+        self.assertEqual(
+            [(size, thumbnail.width, thumbnail.height) for size, thumbnail in instance.img_srcset_data],
+            [(576, 576, 432), (768, 768, 576)],
+        )
+
     def test_img_src(self):
         instance = self.picture
         # thumbnail is generated
@@ -231,3 +294,191 @@ class PictureModelTestCase(TestCase):
         self.assertEqual(instance.img_src, "")
         instance.external_picture = self.external_picture
         self.assertEqual(instance.img_src, self.external_picture)
+
+    def test_img_src_is_memoized(self):
+        instance = self.picture
+        with mock.patch(
+            "djangocms_picture.models.get_thumbnails", wraps=thumbnails.get_thumbnails,
+        ) as get_thumbnails:
+            img_src = instance.img_src
+            self.assertEqual(instance.img_src, img_src)
+            self.assertEqual(instance.img_srcset_data, instance.img_srcset_data)
+            # the source and the 576 breakpoint are resolved together
+            self.assertEqual(get_thumbnails.call_count, 1)
+            self.assertEqual(len(get_thumbnails.call_args[0][1]), 2)
+            # changing a relevant field invalidates the cached values
+            instance.use_crop = True
+            self.assertNotEqual(instance.img_src, img_src)
+            self.assertEqual(get_thumbnails.call_count, 2)
+
+    def test_prefetch_pictures(self):
+        Picture.objects.update(link_url=None)
+        instances = list(Picture.objects.all())
+        page_url = self.page.get_absolute_url()
+        # images, linked pages and their urls
+        with self.assertNumQueries(3):
+            prefetch_pictures(instances)
+        with self.assertNumQueries(0):
+            for instance in instances:
+                self.assertEqual(instance.picture.label, "test_file.jpg")
+                self.assertIsNone(instance.thumbnail_options)
+                self.assertEqual(instance.get_link(), page_url)
+
+    @override_settings(DJANGOCMS_PICTURE_VARIANT_MANIFEST=True)
+    def test_variant_manifest(self):
+        instance = self.picture
+        # created before the manifest was enabled
+        self.assertIsNone(instance.get_variant_manifest())
+        instance.save()
+        manifest = instance.get_variant_manifest()
+        self.assertEqual(manifest["img_src"]["width"], 640)
+        self.assertEqual(manifest["img_src"]["height"], 480)
+        self.assertEqual(manifest["srcset"][0][0], 576)
+        self.assertEqual(manifest["srcset"][0][1]["width"], 576)
+
+        instance = Picture.objects.get(pk=instance.pk)
+        with mock.patch("djangocms_picture.models.get_thumbnails") as get_thumbnails:
+            self.assertEqual(instance.img_src, manifest["img_src"]["url"])
+            self.assertEqual(instance.img_srcset_data[0][1].url, manifest["srcset"][0][1]["url"])
+            get_thumbnails.assert_not_called()
+
+        # changing the image rebuilds the manifest
+        instance.picture.subject_location = "100,100"
+        instance.picture.save()
+        instance.refresh_from_db()
+        self.assertNotEqual(instance.variant_manifest["key"], manifest["key"])
+        self.assertEqual(instance.get_variant_manifest(), instance.variant_manifest)
+
+    def test_img_sources(self):
+        instance = self.picture
+        self.assertEqual(instance.img_sources, [])
+        with self.settings(DJANGOCMS_PICTURE_MODERN_IMAGES=True):
+            sources = instance.img_sources
+            self.assertEqual([source["type"] for source in sources], ["image/avif", "image/webp"])
+            self.assertTrue(sources[0]["src"].url.endswith(".avif"))
+            self.assertTrue(sources[1]["src"].url.endswith(".webp"))
+            self.assertEqual(sources[1]["srcset"][0][0], 576)
+            self.assertTrue(sources[1]["srcset"][0][1].url.endswith(".webp"))
+            # the original size is never converted
+            instance.use_no_cropping = True
+            self.assertEqual(instance.img_sources, [])
+            instance.use_no_cropping = False
+            instance.use_modern_formats = "no"
+            self.assertEqual(instance.img_sources, [])
+
+            # a cold render resolves all formats with a single decode
+            instance = Picture.objects.create(template="default", picture=get_filer_image(), width=720, height=480)
+            with mock.patch.object(thumbnails, "decode_source", wraps=thumbnails.decode_source) as decode_source:
+                self.assertTrue(instance.img_src.endswith(".jpg"))
+                self.assertEqual(len(instance.img_srcset_data), 1)
+                self.assertEqual(len(instance.img_sources), 2)
+            self.assertEqual(decode_source.call_count, 1)
+
+    @override_settings(DJANGOCMS_PICTURE_RESPONSIVE_IMAGES_DENSITIES=[1, 2, 3])
+    def test_img_density_srcset_data(self):
+        instance = self.picture
+        # width descriptors are replaced by density descriptors
+        self.assertIsNone(instance.img_srcset_data)
+        # the 640x480 thumbnail can only be provided at 1.25x by the 800x600 source
+        self.assertEqual(
+            instance.get_img_density_options(),
+            [(1.25, {"size": (900, 600), "crop": False, "upscale": False, "subject_location": ""})],
+        )
+        self.assertIsInstance(instance.img_density_srcset_data[0][1], ThumbnailFile)
+
+        instance.width = 200
+        instance.height = 150
+        instance.use_automatic_scaling = False
+        self.assertEqual(
+            [(density, options["size"]) for density, options in instance.get_img_density_options()],
+            [(2, (400, 300)), (3, (600, 450))],
+        )
+        instance.external_picture = self.external_picture
+        self.assertIsNone(instance.img_density_srcset_data)
+
+    @override_settings(DJANGOCMS_PICTURE_PREVIEWS=True)
+    def test_preview(self):
+        instance = self.picture
+        preview = instance.preview
+        self.assertTrue(preview["src"].startswith("data:image/jpeg;base64,"))
+        self.assertRegex(preview["color"], r"^#[0-9a-f]{6}$")
+        self.assertEqual((preview["width"], preview["height"]), (16, 12))
+
+        # the preview is computed once per image file
+        instance.refresh_from_db()
+        with mock.patch("djangocms_picture.previews.generate_preview") as generate_preview:
+            self.assertEqual(instance.preview, preview)
+            generate_preview.assert_not_called()
+
+        with self.settings(DJANGOCMS_PICTURE_VARIANT_MANIFEST=True):
+            instance.save()
+            self.assertEqual(instance.get_variant_manifest()["preview"], preview)
+
+        instance.external_picture = self.external_picture
+        self.assertIsNone(instance.preview)
+
+    @override_settings(DJANGOCMS_PICTURE_PREVIEWS=True)
+    def test_preview_rotated_and_transparent(self):
+        # the preview shows the image as rotated by its EXIF orientation
+        image = get_filer_image(size=(800, 400), orientation=6)
+        preview = Picture.objects.create(template="default", picture=image).preview
+        self.assertEqual((preview["width"], preview["height"]), (8, 16))
+
+        # the preview would show through transparent areas
+        image = get_filer_image("logo.png", mode="RGBA")
+        with mock.patch("djangocms_picture.previews.generate_preview", wraps=generate_preview) as generate:
+            instance = Picture.objects.create(template="default", picture=image)
+            self.assertIsNone(instance.preview)
+            self.assertIsNone(Picture.objects.get(pk=instance.pk).preview)
+        self.assertEqual(generate.call_count, 1)
+
+    def test_img_dimensions_rotated(self):
+        # easy_thumbnails rotates the image by its EXIF orientation, filer
+        # stores the size of the file as is
+        image = get_filer_image(size=(800, 400), orientation=6)
+        instance = Picture.objects.create(template="default", picture=image, width=200, use_automatic_scaling=False)
+        self.assertEqual(instance.source_size, (400, 800))
+        self.assertEqual(instance.img_dimensions, (200, 400))
+        self.assertEqual(instance.img_dimensions, instance.get_img_src_thumbnail().image.size)
+
+        with self.settings(DJANGOCMS_PICTURE_THUMBNAIL_CACHE_SIZE=10):
+            thumbnails.get_thumbnail_cache().clear()
+            Picture.objects.get(pk=instance.pk).get_img_src_thumbnail()
+            thumbnail = Picture.objects.get(pk=instance.pk).get_img_src_thumbnail()
+            self.assertEqual((thumbnail.width, thumbnail.height), (200, 400))
+
+        instance = Picture.objects.get(pk=instance.pk)
+        instance.use_no_cropping = True
+        self.assertEqual(instance.img_dimensions, (400, 800))
+
+        # the orientation is stored on the picture, rendering never opens
+        # the file. Without it the image is taken as upright
+        self.assertEqual(instance.picture_orientation, 6)
+        Picture.objects.filter(pk=instance.pk).update(picture_orientation=None)
+        with mock.patch("PIL.Image.open") as image_open:
+            self.assertEqual(Picture.objects.get(pk=instance.pk).img_dimensions, (200, 100))
+        image_open.assert_not_called()
+
+        # saving the image stores its orientation again, images no picture
+        # shows are not read
+        image.save()
+        self.assertEqual(Picture.objects.get(pk=instance.pk).picture_orientation, 6)
+        with mock.patch("djangocms_picture.signals.read_orientation") as read_orientation:
+            get_filer_image(orientation=6)
+        read_orientation.assert_not_called()
+
+    def test_img_dimensions(self):
+        instance = self.picture
+        with mock.patch("PIL.Image.open") as image_open:
+            self.assertEqual(instance.img_dimensions, (640, 480))
+            image_open.assert_not_called()
+        self.assertEqual(instance.img_dimensions, instance.get_img_src_thumbnail().image.size)
+        instance.use_crop = True
+        self.assertEqual(instance.img_dimensions, (720, 480))
+        instance.use_crop = False
+        instance.use_no_cropping = True
+        self.assertEqual(instance.img_dimensions, (800, 600))
+        instance.external_picture = self.external_picture
+        self.assertEqual(instance.img_dimensions, (720, 480))
+        instance.height = None
+        self.assertIsNone(instance.img_dimensions)
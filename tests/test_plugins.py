@@ -1,6 +1,16 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.template import Context
+from django.test import override_settings
+
 from cms.api import add_plugin
 from cms.test_utils.testcases import CMSTestCase
 
+from filer.models import ThumbnailOption
+from sekizai.context import SekizaiContext
+from sekizai.helpers import get_varname
+
 from djangocms_picture.cms_plugins import PicturePlugin
 from djangocms_picture.models import get_alignment
 
@@ -59,3 +69,196 @@ class PicturePluginsTestCase(TestFixture, CMSTestCase):
             response = self.client.get(self.request_url)
 
         self.assertContains(response, 'align-right')
+
+    @override_settings(DJANGOCMS_PICTURE_MODERN_IMAGES=True)
+    def test_modern_formats(self):
+        add_plugin(
+            placeholder=self.placeholder,
+            plugin_type=PicturePlugin.__name__,
+            language=self.language,
+            picture=self.picture,
+        )
+        self.publish(self.page, self.language)
+
+        with self.login_user_context(self.superuser):
+            response = self.client.get(self.request_url)
+
+        self.assertContains(response, "<picture>")
+        self.assertContains(response, '<source type="image/avif"')
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, 'src="/media/filer_public_thumbnails/filer_public')
+
+    @override_settings(DJANGOCMS_PICTURE_MODERN_IMAGES=True)
+    def test_srcset_descriptors(self):
+        # an 800x600 image fitted into 720x480 is rendered 640px wide
+        plugin = add_plugin(
+            placeholder=self.placeholder,
+            plugin_type=PicturePlugin.__name__,
+            language=self.language,
+            picture=self.picture,
+            width=720,
+            height=480,
+            use_automatic_scaling=False,
+        )
+        self.publish(self.page, self.language)
+
+        with self.login_user_context(self.superuser):
+            response = self.client.get(self.request_url)
+        content = " ".join(response.content.decode().split())
+
+        self.assertIn('width="640" height="480"', content)
+        self.assertIn("{} 640w".format(plugin.img_src), content)
+        self.assertIn(".webp 640w", content)
+        self.assertEqual(content.count("(max-width: 576px) 576px, 640px"), 3)
+        self.assertNotIn("800w", content)
+        self.assertNotIn("720w", content)
+
+    @override_settings(DJANGOCMS_PICTURE_FRAGMENT_CACHE=True)
+    def test_fragment_cache(self):
+        cache.clear()
+        plugin = add_plugin(
+            placeholder=self.placeholder,
+            plugin_type=PicturePlugin.__name__,
+            language=self.language,
+            picture=self.picture,
+            caption_text="first caption",
+        )
+        self.publish(self.page, self.language)
+
+        with self.login_user_context(self.superuser):
+            response = self.client.get(self.request_url)
+        self.assertContains(response, 'src="/media/filer_public_thumbnails/filer_public')
+        self.assertContains(response, "first caption")
+
+        # warm hits skip the thumbnail lookups
+        with mock.patch("djangocms_picture.models.get_thumbnails") as get_thumbnails:
+            with self.login_user_context(self.superuser):
+                cached_response = self.client.get(self.request_url)
+            get_thumbnails.assert_not_called()
+        self.assertEqual(response.content, cached_response.content)
+
+        # changing the plugin invalidates the fragment
+        plugin.caption_text = "second caption"
+        plugin.save()
+        with self.login_user_context(self.superuser):
+            response = self.client.get(self.request_url)
+        self.assertContains(response, "second caption")
+
+    @override_settings(DJANGOCMS_PICTURE_FRAGMENT_CACHE=True)
+    def test_fragment_cache_thumbnail_options(self):
+        cache.clear()
+        thumbnail_options = ThumbnailOption.objects.create(
+            name="preset",
+            width=300,
+            height=200,
+        )
+        add_plugin(
+            placeholder=self.placeholder,
+            plugin_type=PicturePlugin.__name__,
+            language=self.language,
+            picture=self.picture,
+            thumbnail_options=thumbnail_options,
+        )
+        self.publish(self.page, self.language)
+
+        with self.login_user_context(self.superuser):
+            response = self.client.get(self.request_url)
+        self.assertContains(response, "__300x200_")
+
+        # editing the preset invalidates the fragment
+        thumbnail_options.width = 120
+        thumbnail_options.save()
+        with self.login_user_context(self.superuser):
+            response = self.client.get(self.request_url)
+        self.assertContains(response, "__120x200_")
+        self.assertNotContains(response, "__300x200_")
+
+    @override_settings(DJANGOCMS_PICTURE_FRAGMENT_CACHE=True)
+    def test_fragment_cache_sekizai(self):
+        cache.clear()
+        plugin = add_plugin(
+            placeholder=self.placeholder,
+            plugin_type=PicturePlugin.__name__,
+            language=self.language,
+            picture=self.picture,
+            template="sekizai",
+        )
+        plugin_class = plugin.get_plugin_class_instance()
+        # the second render is a warm hit
+        for _ in range(2):
+            context = plugin_class.render(SekizaiContext(), plugin, self.placeholder)
+            self.assertIn('<img src="/media/', context["picture_fragment"])
+            self.assertEqual(
+                list(context[get_varname()]["css"]),
+                ['<link rel="stylesheet" href="/static/picture.css">'],
+            )
+
+    def test_picture_sizes(self):
+        plugin = add_plugin(
+            placeholder=self.placeholder,
+            plugin_type=PicturePlugin.__name__,
+            language=self.language,
+            picture=self.picture,
+        )
+        plugin_class = plugin.get_plugin_class_instance()
+        self.assertIsNone(plugin_class.get_picture_sizes(Context({"width": 720}), plugin))
+        with self.settings(DJANGOCMS_PICTURE_SIZES_FROM_WIDTH=True):
+            self.assertEqual(
+                plugin_class.get_picture_sizes(Context({"width": 720}), plugin),
+                "(max-width: 720px) 100vw, 720px",
+            )
+        with self.settings(DJANGOCMS_PICTURE_SIZES={"default": "50vw"}):
+            self.assertEqual(plugin_class.get_picture_sizes(Context(), plugin), "50vw")
+            # a parent template can describe the slot the picture is rendered in
+            context = Context({"picture_sizes": "(min-width: 992px) 33vw, 100vw"})
+            self.assertEqual(plugin_class.get_picture_sizes(context, plugin), "(min-width: 992px) 33vw, 100vw")
+            plugin.sizes = "100vw"
+            self.assertEqual(plugin_class.get_picture_sizes(context, plugin), "100vw")
+
+        self.publish(self.page, self.language)
+        with self.login_user_context(self.superuser):
+            response = self.client.get(self.request_url)
+        self.assertNotContains(response, "100vw")
+        plugin.save()
+        with self.login_user_context(self.superuser):
+            response = self.client.get(self.request_url)
+        self.assertContains(response, "100vw")
+
+    def test_loading_attributes(self):
+        for index in range(3):
+            add_plugin(
+                placeholder=self.placeholder,
+                plugin_type=PicturePlugin.__name__,
+                language=self.language,
+                picture=self.picture,
+            )
+        self.publish(self.page, self.language)
+
+        with self.login_user_context(self.superuser):
+            response = self.client.get(self.request_url)
+        # only the first picture of the request is loaded eagerly
+        self.assertContains(response, 'loading="eager"', count=1)
+        self.assertContains(response, 'fetchpriority="high"', count=1)
+        self.assertContains(response, 'loading="lazy"', count=2)
+        self.assertContains(response, 'decoding="async"', count=3)
+
+        with self.settings(DJANGOCMS_PICTURE_EAGER_IMAGES=0):
+            with self.login_user_context(self.superuser):
+                response = self.client.get(self.request_url)
+        self.assertContains(response, 'loading="lazy"', count=3)
+
+        # attributes of the plugin are not overridden
+        plugin_class = PicturePlugin()
+        plugin = add_plugin(
+            placeholder=self.placeholder,
+            plugin_type=PicturePlugin.__name__,
+            language=self.language,
+            picture=self.picture,
+            attributes={"loading": "eager"},
+        )
+        self.assertEqual(
+            plugin_class.get_loading_attributes(Context(), plugin),
+            {"decoding": "async", "fetchpriority": "high"},
+        )
+        with self.settings(DJANGOCMS_PICTURE_LOADING_ATTRIBUTES=False):
+            self.assertEqual(plugin_class.get_loading_attributes(Context(), plugin), {})
@@ -0,0 +1,112 @@
+import random
+from unittest import mock, skipIf
+
+from django.test import TestCase
+
+from filer.models import Image, ThumbnailOption
+
+from djangocms_picture import sizes
+from djangocms_picture.models import PICTURE_RATIO, Picture
+
+from .helpers import get_filer_image
+
+
+def random_dimension(rng, maximum):
+    return rng.choice([None, 0, rng.randint(1, maximum)])
+
+
+def random_picture(rng):
+    # an unsaved picture with a random combination of size options
+    picture = Picture(
+        width=random_dimension(rng, 2000),
+        height=random_dimension(rng, 2000),
+        use_automatic_scaling=rng.random() < 0.5,
+        use_crop=rng.random() < 0.5,
+        use_upscale=rng.random() < 0.5,
+    )
+    if rng.random() < 0.9:
+        picture.picture = Image(
+            _width=rng.choice([None, float(rng.randint(1, 4000))]),
+            _height=rng.choice([None, float(rng.randint(1, 4000))]),
+        )
+    if rng.random() < 0.3:
+        picture.thumbnail_options = ThumbnailOption(
+            width=rng.randint(0, 1000),
+            height=rng.randint(0, 1000),
+            crop=rng.random() < 0.5,
+            upscale=rng.random() < 0.5,
+        )
+    return picture
+
+
+def get_row(pk, picture):
+    options = picture.thumbnail_options
+    return (
+        pk,
+        picture.width,
+        picture.height,
+        picture.use_automatic_scaling,
+        picture.use_crop,
+        picture.use_upscale,
+        options is not None,
+        options.width if options else None,
+        options.height if options else None,
+        options.crop if options else None,
+        options.upscale if options else None,
+    ) + (picture.source_size or (None, None))
+
+
+class ComputeSizesTestCase(TestCase):
+
+    def assertSameSizes(self, compute, seed):
+        rng = random.Random(seed)
+        pictures = [random_picture(rng) for index in range(500)]
+        rows = [get_row(pk, picture) for pk, picture in enumerate(pictures)]
+        for width, height in [(None, None), (0, 0), (800, None), (rng.randint(1, 2000), rng.randint(1, 2000))]:
+            results = compute(rows, width, height, PICTURE_RATIO)
+            for pk, picture in enumerate(pictures):
+                self.assertEqual(
+                    results[pk],
+                    picture.get_size(width, height),
+                    "seed {}, row {}".format(seed, rows[pk]),
+                )
+
+    def test_python(self):
+        for seed in range(5):
+            self.assertSameSizes(sizes.compute_sizes_python, seed)
+
+    @skipIf(sizes.numpy is None, "NumPy is not installed")
+    def test_numpy(self):
+        for seed in range(5):
+            self.assertSameSizes(sizes.compute_sizes_numpy, seed)
+
+
+class GetSizesTestCase(TestCase):
+
+    def test_get_sizes(self):
+        image = get_filer_image(size=(800, 600))
+        options = ThumbnailOption.objects.create(name="square", width=300, height=300, crop=True)
+        pictures = [
+            Picture.objects.create(template="default", picture=image, width=720, height=480),
+            Picture.objects.create(template="default", picture=image, width=400, use_crop=True, use_automatic_scaling=False),
+            Picture.objects.create(template="default", picture=image, thumbnail_options=options),
+            Picture.objects.create(template="default", external_picture="https://www.example.com/image.jpg", width=300),
+            # rotated by its EXIF orientation the image is portrait
+            Picture.objects.create(
+                template="default",
+                picture=get_filer_image(size=(800, 600), orientation=6),
+                width=400,
+                use_crop=True,
+                use_automatic_scaling=False,
+            ),
+        ]
+        for implementation in ["numpy", None]:
+            patch = mock.patch.object(sizes, "numpy", sizes.numpy if implementation else None)
+            with patch, self.assertNumQueries(1):
+                results = Picture.get_sizes(Picture.objects.all(), 1000, 0)
+            for picture in pictures:
+                picture = Picture.objects.get(pk=picture.pk)
+                self.assertEqual(results[picture.pk], picture.get_size(1000, 0))
+        self.assertEqual(results[pictures[1].pk]["size"], (400, 247))
+        self.assertEqual(results[pictures[4].pk]["size"], (400, 647))
+        self.assertEqual(Picture.get_sizes(Picture.objects.none()), {})
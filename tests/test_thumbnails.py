@@ -0,0 +1,326 @@
+import os
+from tempfile import mkdtemp
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+
+from easy_thumbnails.files import Thumbnailer, ThumbnailFile
+
+from djangocms_picture import thumbnails
+from djangocms_picture.models import Picture
+from djangocms_picture.signals import warm_image_thumbnails
+from djangocms_picture.thumbnails import (
+    PLACEHOLDER_URL, CacheLock, FileLock, LocalBackend, PendingThumbnail,
+    StoredThumbnail, ThumbnailCache, decode_source, get_backend, get_lock,
+    get_picture_thumbnailer, get_thumbnail, get_thumbnail_cache,
+    get_thumbnail_dimensions, get_thumbnails,
+)
+
+from .helpers import get_filer_image
+
+
+class ThumbnailDimensionsTestCase(TestCase):
+
+    def test_get_thumbnail_dimensions(self):
+        self.assertEqual(get_thumbnail_dimensions((800, 600), (720, 480)), (640, 480))
+        self.assertEqual(get_thumbnail_dimensions((800, 600), (720, 480), crop=True), (720, 480))
+        self.assertEqual(get_thumbnail_dimensions((800, 600), (1600, 1200)), (800, 600))
+        self.assertEqual(get_thumbnail_dimensions((800, 600), (1600, 1200), upscale=True), (1600, 1200))
+        self.assertEqual(get_thumbnail_dimensions((800, 600), (400, 0)), (400, 300))
+        self.assertEqual(get_thumbnail_dimensions((800, 600), (1000, 1000), crop=True), (800, 600))
+
+
+class GenerateThumbnailsTestCase(TestCase):
+
+    def test_get_thumbnails(self):
+        image = get_filer_image(size=(1600, 1200))
+        variants = [
+            ({"size": (1200, 900), "crop": False, "upscale": False}, None),
+            ({"size": (576, 432), "crop": False, "upscale": False}, None),
+            ({"size": (400, 400), "crop": True, "upscale": False, "subject_location": "400,300"}, "webp"),
+            ({"size": (576, 432), "crop": False, "upscale": False}, None),
+        ]
+        with mock.patch.object(thumbnails, "decode_source", wraps=thumbnails.decode_source) as decode_source:
+            results = get_thumbnails(image, variants)
+        # the source is decoded once for all variants
+        self.assertEqual(decode_source.call_count, 1)
+        self.assertEqual(
+            [(thumbnail.width, thumbnail.height) for thumbnail in results],
+            [(1200, 900), (576, 432), (400, 400), (576, 432)],
+        )
+        self.assertEqual(results[1].name, results[3].name)
+        self.assertTrue(results[2].name.endswith(".webp"))
+
+        # existing thumbnails are not generated again
+        with mock.patch.object(thumbnails, "generate_thumbnails") as generate_thumbnails:
+            self.assertEqual(
+                [thumbnail.name for thumbnail in get_thumbnails(image, variants)],
+                [thumbnail.name for thumbnail in results],
+            )
+        generate_thumbnails.assert_not_called()
+
+    def test_decode_source(self):
+        image = get_filer_image(size=(1600, 1200))
+        thumbnailer = get_picture_thumbnailer(image)
+        options = thumbnailer.get_options({"size": (576, 432), "crop": False, "upscale": False})
+        self.assertEqual(decode_source(thumbnailer, options).size, (1600, 1200))
+        # JPEG files are decoded at the smallest scale still large enough
+        decoded = decode_source(thumbnailer, options, variants=[options])
+        self.assertEqual(decoded.size, (800, 600))
+        self.assertEqual(decoded.info[thumbnails.SOURCE_SIZE_INFO], (1600, 1200))
+        larger = thumbnailer.get_options({"size": (1200, 900), "crop": False, "upscale": False})
+        self.assertEqual(decode_source(thumbnailer, options, variants=[options, larger]).size, (1600, 1200))
+
+
+@override_settings(DJANGOCMS_PICTURE_IMMUTABLE_THUMBNAILS=True)
+class ImmutableThumbnailsTestCase(TestCase):
+
+    def test_img_src(self):
+        image = get_filer_image()
+        instance = Picture.objects.create(template="default", picture=image, width=720, height=480)
+        img_src = instance.img_src
+        self.assertIn("/immutable/{}/{}_".format(image.sha1[:2], image.sha1), img_src)
+        self.assertTrue(img_src.endswith(".jpg"))
+        for size, thumbnail in instance.img_srcset_data:
+            self.assertIn(image.sha1, thumbnail.url)
+            self.assertNotEqual(thumbnail.url, img_src)
+        # the thumbnails are found again under their names
+        instance.refresh_from_db()
+        self.assertEqual(instance.img_src, img_src)
+        with self.settings(DJANGOCMS_PICTURE_IMMUTABLE_THUMBNAILS=False):
+            self.assertNotIn(image.sha1, instance.img_src)
+
+        # a new version of the image gets new names
+        image.sha1 = "0" * 40
+        image.save()
+        instance.refresh_from_db()
+        self.assertIn("/immutable/00/{}_".format(image.sha1), instance.img_src)
+
+    def test_extension(self):
+        image = get_filer_image()
+        thumbnailer = get_picture_thumbnailer(image, "webp")
+        name = thumbnailer.get_thumbnail_name({"size": (100, 100)})
+        self.assertTrue(name.endswith(".webp"))
+        self.assertNotEqual(name, thumbnailer.get_thumbnail_name({"size": (100, 100), "crop": True}))
+
+
+class ThumbnailLockTestCase(TestCase):
+
+    def assertLocks(self, lock):
+        handle = lock.acquire("thumbnail.jpg", 0)
+        self.assertIsNotNone(handle)
+        self.assertIsNone(lock.acquire("thumbnail.jpg", 0.1))
+        self.assertIsNotNone(lock.acquire("other.jpg", 0))
+        lock.release(handle)
+        self.assertIsNotNone(lock.acquire("thumbnail.jpg", 0))
+
+    def test_file_lock(self):
+        with self.settings(DJANGOCMS_PICTURE_THUMBNAIL_LOCK_DIR=mkdtemp()):
+            self.assertLocks(FileLock())
+
+        # the thumbnails share a fixed number of lock files
+        directory = mkdtemp()
+        with self.settings(DJANGOCMS_PICTURE_THUMBNAIL_LOCK_DIR=directory, DJANGOCMS_PICTURE_THUMBNAIL_LOCK_FILES=4):
+            lock = FileLock()
+        for index in range(50):
+            lock.release(lock.acquire("thumbnail{}.jpg".format(index), 0))
+        self.assertEqual(sorted(os.listdir(directory)), ["0.lock", "1.lock", "2.lock", "3.lock"])
+
+        with mock.patch.object(thumbnails, "fcntl", None):
+            with self.assertRaises(ImproperlyConfigured):
+                FileLock()
+
+    def test_cache_lock(self):
+        self.assertLocks(CacheLock())
+
+
+@override_settings(
+    DJANGOCMS_PICTURE_THUMBNAIL_LOCK="djangocms_picture.thumbnails.CacheLock",
+    DJANGOCMS_PICTURE_THUMBNAIL_LOCK_TIMEOUT=0,
+)
+class LockedThumbnailsTestCase(TestCase):
+
+    def setUp(self):
+        self.picture = Picture.objects.create(template="default", picture=get_filer_image(), width=720, height=480)
+        self.lock = get_lock()
+
+    def test_shared_lock_files(self):
+        # variants sharing a lock file do not wait for each other
+        with self.settings(
+            DJANGOCMS_PICTURE_THUMBNAIL_LOCK_DIR=mkdtemp(),
+            DJANGOCMS_PICTURE_THUMBNAIL_LOCK_FILES=1,
+        ), mock.patch.object(thumbnails, "get_lock", return_value=FileLock()):
+            self.assertFalse(self.picture.has_pending_thumbnails())
+            self.assertIsInstance(self.picture.img_srcset_data[0][1], ThumbnailFile)
+
+    def test_locked(self):
+        instance = self.picture
+        thumbnailer = get_picture_thumbnailer(instance.picture)
+        options = thumbnailer.get_options(instance.get_img_src_options())
+        # another worker generates the thumbnail
+        handle = self.lock.acquire(thumbnailer.get_thumbnail_name(options), 0)
+        self.assertEqual(instance.img_src, instance.picture.url)
+        self.assertTrue(instance.has_pending_thumbnails())
+        # the srcset thumbnail was not locked
+        self.assertIsInstance(instance.img_srcset_data[0][1], ThumbnailFile)
+        self.lock.release(handle)
+        instance.refresh_from_db()
+        self.assertIn("/media/filer_public_thumbnails/filer_public/", instance.img_src)
+
+    def test_reuse(self):
+        image = self.picture.picture
+        options = self.picture.get_img_src_options()
+        acquire = self.lock.acquire
+
+        def generate_and_acquire(key, timeout):
+            # another worker finishes the thumbnail while this one waits
+            get_picture_thumbnailer(image).get_thumbnail(options)
+            return acquire(key, timeout)
+
+        with mock.patch.object(self.lock, "acquire", side_effect=generate_and_acquire):
+            with mock.patch.object(thumbnails, "render_thumbnail") as render_thumbnail:
+                thumbnail = get_thumbnail(image, options)
+        render_thumbnail.assert_not_called()
+        self.assertEqual((thumbnail.width, thumbnail.height), (640, 480))
+
+
+class ThumbnailCacheTestCase(TestCase):
+
+    def test_lru(self):
+        cache = ThumbnailCache(2)
+        cache.set(("a",), ("/a.jpg", 1, 1))
+        cache.set(("b",), ("/b.jpg", 1, 1))
+        self.assertEqual(cache.get(("a",)), ("/a.jpg", 1, 1))
+        # the least recently used entry is evicted
+        cache.set(("c",), ("/c.jpg", 1, 1))
+        self.assertIsNone(cache.get(("b",)))
+        self.assertEqual(cache.get_stats(), {"hits": 1, "misses": 1, "size": 2, "maxsize": 2})
+        cache.invalidate("a")
+        self.assertIsNone(cache.get(("a",)))
+
+    def test_shared_cache(self):
+        ThumbnailCache(2, "default").set(("sha1", "name"), ("/a.jpg", 1, 1))
+        self.assertEqual(ThumbnailCache(2, "default").get(("sha1", "name")), ("/a.jpg", 1, 1))
+
+    @override_settings(DJANGOCMS_PICTURE_THUMBNAIL_CACHE_SIZE=100)
+    def test_img_src(self):
+        cache = get_thumbnail_cache()
+        cache.clear()
+        picture = Picture.objects.create(template="default", picture=get_filer_image(), width=720, height=480)
+        img_src = picture.img_src
+        img_srcset_data = picture.img_srcset_data
+        self.assertEqual(cache.get_stats()["size"], 2)
+
+        instance = Picture.objects.get(pk=picture.pk)
+        with mock.patch.object(Thumbnailer, "get_existing_thumbnail") as get_existing_thumbnail:
+            self.assertEqual(instance.img_src, img_src)
+            self.assertEqual(instance.img_srcset_data[0][1].url, img_srcset_data[0][1].url)
+        get_existing_thumbnail.assert_not_called()
+        self.assertIsInstance(instance.get_img_src_thumbnail(), StoredThumbnail)
+        self.assertEqual(instance.img_dimensions, (640, 480))
+        self.assertEqual(cache.get_stats()["hits"], 2)
+
+        # saving the image forgets its thumbnails
+        instance.picture.save()
+        self.assertEqual(cache.get_stats()["size"], 0)
+
+
+@override_settings(
+    DJANGOCMS_PICTURE_EAGER_THUMBNAILS=True,
+    DJANGOCMS_PICTURE_THUMBNAIL_BACKEND="djangocms_picture.thumbnails.LocalBackend",
+)
+class EagerThumbnailsTestCase(TestCase):
+
+    def setUp(self):
+        self.backend = get_backend()
+        self.backend.queue.clear()
+
+    def test_image_saved(self):
+        image = get_filer_image()
+        pictures = [
+            Picture.objects.create(template="default", picture=image, width=720, height=480)
+            for index in range(3)
+        ]
+        self.backend.queue.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+            image.save()
+        # one job for all pictures and saves
+        self.assertEqual(list(self.backend.queue), ["eager:{}".format(image.pk)])
+        with mock.patch.object(thumbnails, "generate_thumbnails", wraps=thumbnails.generate_thumbnails) as generate:
+            self.backend.run()
+        generate.assert_called_once()
+        # the img_src and the 576 breakpoint
+        self.assertEqual(len(generate.call_args[0][1]), 2)
+
+        instance = Picture.objects.get(pk=pictures[0].pk)
+        with mock.patch.object(thumbnails, "generate_thumbnails") as generate:
+            instance.img_src
+            instance.img_srcset_data
+        generate.assert_not_called()
+        self.assertEqual(warm_image_thumbnails(image.pk), 0)
+
+    @override_settings(DJANGOCMS_PICTURE_EAGER_THUMBNAILS=False)
+    def test_disabled(self):
+        image = get_filer_image()
+        Picture.objects.create(template="default", picture=image)
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        self.assertEqual(len(self.backend.queue), 0)
+
+
+@override_settings(
+    DJANGOCMS_PICTURE_THUMBNAIL_ASYNC=True,
+    DJANGOCMS_PICTURE_THUMBNAIL_BACKEND="djangocms_picture.thumbnails.LocalBackend",
+)
+class AsyncThumbnailTestCase(TestCase):
+
+    def setUp(self):
+        self.picture = Picture.objects.create(
+            template="default",
+            picture=get_filer_image(),
+        )
+        self.picture.refresh_from_db()
+        self.backend = get_backend()
+        self.backend.queue.clear()
+
+    def test_backend(self):
+        self.assertIsInstance(self.backend, LocalBackend)
+        self.assertIs(get_backend(), self.backend)
+
+    def test_img_src(self):
+        instance = self.picture
+        # the original is rendered while the thumbnail is queued
+        self.assertEqual(instance.img_src, instance.picture.url)
+        self.assertEqual(len(self.backend.queue), 1)
+        self.backend.run()
+        self.assertEqual(len(self.backend.queue), 0)
+        instance.refresh_from_db()
+        self.assertIn("/media/filer_public_thumbnails/filer_public/", instance.img_src)
+        self.assertEqual(len(self.backend.queue), 0)
+
+    def test_img_srcset_data(self):
+        instance = self.picture
+        for size, thumbnail in instance.img_srcset_data:
+            self.assertIsInstance(thumbnail, PendingThumbnail)
+        # the missing variants are generated by a single job, the 992
+        # breakpoint is larger than the picture
+        self.assertEqual(len(self.backend.queue), 1)
+        self.assertEqual(len(instance.img_srcset_data), 2)
+        self.backend.run()
+        instance.refresh_from_db()
+        for size, thumbnail in instance.img_srcset_data:
+            self.assertIsInstance(thumbnail, ThumbnailFile)
+
+    def test_fallback(self):
+        instance = self.picture
+        with self.settings(DJANGOCMS_PICTURE_THUMBNAIL_ASYNC_FALLBACK="placeholder"):
+            self.assertEqual(instance.img_src, PLACEHOLDER_URL)
+        instance.refresh_from_db()
+        with self.settings(DJANGOCMS_PICTURE_THUMBNAIL_ASYNC_FALLBACK="thumbnail"):
+            img_src = instance.img_src
+        self.assertIn("/media/filer_public_thumbnails/filer_public/", img_src)
+        self.backend.run()
+        instance.refresh_from_db()
+        self.assertEqual(instance.img_src, img_src)